@@ -37,11 +37,4 @@ class SignUpView(generic.CreateView):
 
 
 def auto_follow_communities(user):
-    auto_communities = Community.objects.filter(auto_follow=True)
-    for community in auto_communities:
-        cm = CommunityMember.objects.create(
-            user=user,
-            community=community,
-            following=True
-        )
-        cm.save()
+    CommunityMember.objects.follow_communities(user, Community.objects.filter(auto_follow=True))
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('app_api')
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_views = defaultdict(lambda: defaultdict(float))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Counts and times the queries run on the default connection while it is entered."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.db_ms += (time.perf_counter() - start) * 1000
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+class RequestMetrics(QueryCounter):
+    def __init__(self):
+        super().__init__()
+        self.template_ms = 0.0
+        self.rendering = False
+
+
+def query_budget(max_queries):
+    """
+    Declare the most queries a view may run, template rendering included.
+
+    Going over is logged as a warning, or raises QueryBudgetExceeded with QUERY_BUDGET_STRICT
+    set, which the test suite does so an N+1 regression fails the build.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def view(request, *args, **kwargs):
+            with QueryCounter() as counter:
+                response = view_func(request, *args, **kwargs)
+            if counter.count > max_queries:
+                message = f'{request.path} ran {counter.count} queries, its budget is {max_queries}'
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+class TimedTemplate:
+    """A template whose renders count towards the current request's template time."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        # render_to_string calls made while a page renders are part of that page's time
+        if metrics is None or metrics.rendering:
+            return self.template.render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.rendering = False
+            metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing renders for RequestMetricsMiddleware. Use it as the
+    TEMPLATES BACKEND; with the stock backend the template time is reported as 0.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestMetricsMiddleware:
+    """
+    Record each request's query count, database time, template time, total time and response
+    size per view. Every request is logged to app_api and the per view totals are served by
+    base.views.metrics. Template time needs the TimedDjangoTemplates backend.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with metrics:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        view_name = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        with _lock:
+            totals = _views[view_name]
+            totals['requests'] += 1
+            totals['queries'] += metrics.count
+            totals['max_queries'] = max(totals['max_queries'], metrics.count)
+            totals['db_ms'] += metrics.db_ms
+            totals['template_ms'] += metrics.template_ms
+            totals['total_ms'] += total_ms
+            totals['bytes'] += size
+
+        logger.info(f'{view_name} {response.status_code} {metrics.count} queries {metrics.db_ms:.1f}ms db '
+                    f'{metrics.template_ms:.1f}ms templates {total_ms:.1f}ms total {size} bytes')
+        response['Server-Timing'] = (f'db;dur={metrics.db_ms:.1f};desc="{metrics.count} queries", '
+                                     f'tpl;dur={metrics.template_ms:.1f}, total;dur={total_ms:.1f}')
+        return response
+
+
+def view_metrics():
+    """Per view request count and averages since the process started."""
+    with _lock:
+        snapshot = {name: dict(totals) for name, totals in _views.items()}
+    return {name: {
+        'requests': int(totals['requests']),
+        'avg_queries': round(totals['queries'] / totals['requests'], 2),
+        'max_queries': int(totals['max_queries']),
+        'avg_db_ms': round(totals['db_ms'] / totals['requests'], 2),
+        'avg_template_ms': round(totals['template_ms'] / totals['requests'], 2),
+        'avg_total_ms': round(totals['total_ms'] / totals['requests'], 2),
+        'avg_bytes': int(totals['bytes'] / totals['requests']),
+    } for name, totals in snapshot.items()}
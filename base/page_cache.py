@@ -0,0 +1,78 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers, patch_cache_control
+from django.utils.http import http_date
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+PAGE_CACHE_VOTE_PURGE_SECONDS = getattr(settings, 'PAGE_CACHE_VOTE_PURGE_SECONDS', 10)
+INDEX_SCOPE = 'index'
+
+
+def generation_key(scope):
+    return f'page-cache:generation:{scope}'
+
+
+def purge_pages(*scopes):
+    """Drop every cached page of ``scopes`` by moving them to a new generation."""
+    generation = time.time_ns()
+    cache.set_many({generation_key(scope): generation for scope in scopes}, None)
+
+
+def purge_community_pages(community):
+    # the landing page shows posts of the auto followed communities
+    purge_pages(community.slug, INDEX_SCOPE)
+
+
+def purge_for_post_activity(post):
+    """
+    Purge after a vote or comment on ``post``, at most once per PAGE_CACHE_VOTE_PURGE_SECONDS
+    per community. Activity inside that window shows once the pages expire, so a busy post
+    cannot keep the cache empty.
+    """
+    if cache.add(f'page-cache:purged:{post.community_id}', 1, PAGE_CACHE_VOTE_PURGE_SECONDS):
+        purge_community_pages(post.community)
+
+
+def anonymous_page_cache(scope):
+    """
+    Serve a view's successful GET responses to logged out visitors from the cache.
+
+    ``scope`` is a name, or a function of the view's kwargs returning one; purge_pages(scope)
+    invalidates every cached page under it. Responses carry an ETag and Last-Modified so
+    revisits are answered with 304. Logged in users always get the view.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+
+            page_scope = scope(**kwargs) if callable(scope) else scope
+            generation = cache.get(generation_key(page_scope), 0)
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'page-cache:{page_scope}:{generation}:{path_hash}'
+
+            cached = cache.get(key)
+            if cached is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or response.cookies:
+                    return response
+                cached = (response.content, response['Content-Type'], time.time(),
+                          f'"{hashlib.md5(response.content).hexdigest()}"')
+                cache.set(key, cached, PAGE_CACHE_TIMEOUT)
+
+            content, content_type, last_modified, etag = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # the same url renders differently once logged in, and browsers should revalidate
+            patch_vary_headers(response, ['Cookie'])
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            return get_conditional_response(request, etag=etag, last_modified=int(last_modified), response=response)
+        return view
+    return decorator
@@ -0,0 +1,14 @@
+from django import template
+from communities.post_cards import render_post_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    return render_post_cards(posts, context['user'], context.get('is_index', False))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return render_post_cards([post], context['user'], context.get('is_index', False))
@@ -1,34 +1,31 @@
 from django import template
-from django.db.models import Q
-from communities.models import CommunityMember, PostComment
-from users.models import UserMeta
+from users.notifications import has_unread_notifications
 
 register = template.Library()
 
 
 @register.simple_tag
 def is_community_member(community, user):
-    if user.is_authenticated:
-        if CommunityMember.objects.filter(community=community, user=user).exists():
-            return True
-    return False
+    return community.is_member(user)
 
 
 @register.filter(name='has_user_upvote')
 def has_user_upvote(obj, user):
+    # views attach the viewer's votes in bulk with attach_user_votes, only query when they didn't
+    if hasattr(obj, 'user_vote'):
+        return obj.user_vote is True
     return obj.has_user_upvote(user)
 
 
 @register.filter(name='has_user_downvote')
 def has_user_downvote(obj, user):
+    if hasattr(obj, 'user_vote'):
+        return obj.user_vote is False
     return obj.has_user_downvote(user)
 
 
 @register.filter(name='user_has_notification')
 def user_has_notification(user):
     if user.is_authenticated:
-        user_meta = UserMeta.objects.get(user=user)
-        return PostComment.objects.filter(((Q(post__user=user) & Q(postcomment=None))
-                                           | Q(postcomment__user=user))
-                                          & Q(created_at__gt=user_meta.last_notification_check)).exists()
-    return False
\ No newline at end of file
+        return has_unread_notifications(user)
+    return False
@@ -5,4 +5,7 @@ app_name = 'base'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('feed/', views.feed, name='feed'),
+    path('search/', views.search, name='search'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
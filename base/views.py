@@ -1,14 +1,96 @@
+from django.conf import settings
+from django.http import JsonResponse, Http404
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.urls import reverse
 
-from communities.models import Post, CommunityMember, Community
+from .metrics import query_budget, view_metrics
+from .page_cache import anonymous_page_cache, INDEX_SCOPE
+from communities.models import Post, CommunityMember, Community, TimelineEntry, SearchIndexEntry
+from communities.post_cards import post_card_stats
+from communities.pagination import paginate_by_cursor, filter_after_cursor, encode_cursor, cursor_value, PAGE_SIZE
+from communities.ranking import FEED_SORTS, get_sort
+from communities.search import search as search_index
+from communities.voting.vote_functions import attach_user_votes
 
+METRICS_ALLOWED_IPS = frozenset(getattr(settings, 'METRICS_ALLOWED_IPS', ()))
 
-def index(request):
-    posts = None
+
+def home_posts(request):
     if request.user.is_authenticated:
         communities = CommunityMember.objects.filter(user=request.user, following=True).values_list('community', flat=True)
-        posts = Post.objects.filter(community__in=communities)[:20]
     else:
         communities = Community.objects.filter(auto_follow=True)
-        posts = Post.objects.filter(community__in=communities)[:20]
-    return render(request, 'base/index.html', {'posts': posts, 'is_index': True})
+    return Post.objects.filter(community__in=communities).select_related('community', 'user')
+
+
+def timeline_page(user, cursor=None, page_size=PAGE_SIZE):
+    """
+    Newest-first page of the user's materialized home timeline, see TimelineEntryManager.
+
+    Communities too large to fan out are read directly and merged in. Returns (posts, next_cursor)
+    with cursors interchangeable with paginate_by_cursor on ('created_at', 'id').
+    """
+    entries = filter_after_cursor(TimelineEntry.objects.filter(user=user), cursor, ('created_at', 'post_id'))
+    rows = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:page_size + 1])
+
+    large_communities = CommunityMember.objects.filter(user=user, following=True,
+                                                       community__fanout_on_read=True).values_list('community')
+    pulled = filter_after_cursor(Post.objects.filter(community__in=large_communities), cursor, ('created_at', 'id'))
+    rows += pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:page_size + 1]
+
+    rows = sorted(set(rows), reverse=True)
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([cursor_value(value) for value in rows[-1]])
+
+    posts = Post.objects.filter(id__in=[post_id for _, post_id in rows]).select_related('community', 'user')
+    return sorted(posts, key=lambda post: (post.created_at, post.id), reverse=True), next_cursor
+
+
+def home_page(request):
+    sort = get_sort(request)
+    if request.user.is_authenticated and sort == 'new':
+        posts, next_cursor = timeline_page(request.user, request.GET.get('cursor'))
+    else:
+        # hot and top, and anonymous visitors, still order the followed communities' posts on read
+        posts, next_cursor = paginate_by_cursor(home_posts(request), request.GET.get('cursor'), keys=FEED_SORTS[sort])
+    attach_user_votes(request.user, posts=posts)
+    return {'posts': posts, 'next_cursor': next_cursor, 'sort': sort,
+            'feed_url': f'{reverse("base:feed")}?sort={sort}', 'is_index': True}
+
+
+@anonymous_page_cache(INDEX_SCOPE)
+@query_budget(10)
+def index(request):
+    return render(request, 'base/index.html', home_page(request))
+
+
+@anonymous_page_cache(INDEX_SCOPE)
+def feed(request):
+    context = home_page(request)
+    html = render_to_string('communities/post-list.html', context, request=request)
+    return JsonResponse({'html': html, 'next_cursor': context['next_cursor']}, status=200)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('type', SearchIndexEntry.POST)
+    if kind not in dict(SearchIndexEntry.kinds):
+        kind = SearchIndexEntry.POST
+
+    results, next_cursor = search_index(query, request.user, kind, request.GET.get('cursor'))
+    if kind == SearchIndexEntry.POST:
+        attach_user_votes(request.user, posts=results)
+    return render(request, 'base/search.html', {'query': query, 'kind': kind, 'kinds': SearchIndexEntry.kinds,
+                                                'results': results, 'next_cursor': next_cursor,
+                                                'is_index': True})
+
+
+def metrics(request):
+    # open to staff, and to scrapers listed by address. Behind a proxy every request comes from the
+    # proxy's address, so only list addresses no public request can arrive from.
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in METRICS_ALLOWED_IPS):
+        raise Http404
+    return JsonResponse({'views': view_metrics(), 'post_cards': post_card_stats()})
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Post, PostCommentLike, CommunityMember, PostComment, Community, CommunityBans, CommunityJoinRequest
+from .models import Post, PostCommentLike, CommunityMember, PostComment, Community, CommunityBans, CommunityJoinRequest, \
+    ImageBlob, SearchIndexEntry
 
 
 @admin.register(Community)
@@ -31,6 +32,26 @@ class CommunityMemberAdmin(admin.ModelAdmin):
     list_filter = ('user', 'community')
     search_fields = ('user', 'community')
     list_editable = ('community', 'community_rep')
+    actions = ('follow', 'unfollow')
+
+    @staticmethod
+    def by_community(queryset):
+        members = {}
+        for member in queryset.select_related('community'):
+            members.setdefault(member.community, []).append(member.user_id)
+        return members.items()
+
+    @admin.action(description='Follow their community')
+    def follow(self, request, queryset):
+        count = sum(len(CommunityMember.objects.add_followers(community, user_ids))
+                    for community, user_ids in self.by_community(queryset))
+        self.message_user(request, f'{count} members now follow their community.')
+
+    @admin.action(description='Unfollow their community')
+    def unfollow(self, request, queryset):
+        count = sum(CommunityMember.objects.remove_followers(community, user_ids)
+                    for community, user_ids in self.by_community(queryset))
+        self.message_user(request, f'{count} members stopped following their community.')
 
 
 @admin.register(PostComment)
@@ -41,4 +62,26 @@ class PostCommentsAdmin(admin.ModelAdmin):
 @admin.register(CommunityJoinRequest)
 class CommunityJoinRequestAdmin(admin.ModelAdmin):
     list_display = ('user', 'community', 'is_approved', 'is_rejected')
+    list_filter = ('is_approved', 'is_rejected')
+    actions = ('approve', 'reject')
+
+    @admin.action(description='Approve selected join requests')
+    def approve(self, request, queryset):
+        self.message_user(request, f'Approved {queryset.approve()} join requests.')
+
+    @admin.action(description='Reject selected join requests')
+    def reject(self, request, queryset):
+        self.message_user(request, f'Rejected {queryset.reject()} join requests.')
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'image', 'ref_count', 'created_at')
+    search_fields = ('sha256',)
+
 
+@admin.register(SearchIndexEntry)
+class SearchIndexEntryAdmin(admin.ModelAdmin):
+    list_display = ('term', 'kind', 'object_id', 'community', 'weight')
+    list_filter = ('kind',)
+    search_fields = ('term',)
@@ -0,0 +1,65 @@
+from django.conf import settings
+
+from .models import PostComment, COMMENT_PATH_STEP
+
+COMMENT_TREE_MAX_DEPTH = getattr(settings, 'COMMENT_TREE_MAX_DEPTH', 8)
+COMMENT_TREE_MAX_CHILDREN = getattr(settings, 'COMMENT_TREE_MAX_CHILDREN', 20)
+COMMENT_PAGE_SIZE = getattr(settings, 'COMMENT_PAGE_SIZE', 200)
+
+
+def load_comment_tree(post, root=None, after=None, max_depth=COMMENT_TREE_MAX_DEPTH,
+                      max_children=COMMENT_TREE_MAX_CHILDREN, page_size=COMMENT_PAGE_SIZE):
+    """
+    Load a post's comment thread, or the subtree under ``root``, depth first in one query.
+
+    At most ``page_size`` comments are fetched; ``after`` is the path of the last comment of the
+    previous page. Replies nested deeper than ``max_depth`` below the root, and replies past the
+    first ``max_children`` under one parent, are left out and their parent gets ``more_replies``
+    set so the template can link to its subtree. The root's own replies are not capped, that
+    link is how they are reached; they page with ``after`` like a thread's top level comments.
+    Each comment gets ``indent``, its depth relative to the root. Returns (comments, next_after);
+    next_after is None on the last page.
+    """
+    comments = PostComment.objects.filter(post=post).select_related('user', 'community')
+    base_depth = 0
+    if root:
+        comments = comments.filter(path__startswith=root.path)
+        base_depth = root.depth
+    if after:
+        comments = comments.filter(path__gt=after)
+
+    # one level past the limit is fetched only to learn which comments have hidden replies
+    comments = comments.filter(depth__lte=base_depth + max_depth + 1).order_by('path')
+    comments = list(comments[:page_size + 1])
+
+    next_after = None
+    if len(comments) > page_size:
+        comments = comments[:page_size]
+        next_after = comments[-1].path
+
+    tree = []
+    by_path = {}
+    children = {}
+    hidden_prefix = None
+    for comment in comments:
+        if hidden_prefix and comment.path.startswith(hidden_prefix):
+            continue
+        hidden_prefix = None
+
+        comment.post = post
+        comment.more_replies = False
+        comment.indent = comment.depth - base_depth
+        parent = by_path.get(comment.path[:-COMMENT_PATH_STEP])
+
+        if parent is not None:
+            children[parent.id] = children.get(parent.id, 0) + 1
+            too_many = children[parent.id] > max_children and not (root and parent.id == root.id)
+            if comment.indent > max_depth or too_many:
+                parent.more_replies = True
+                hidden_prefix = comment.path
+                continue
+
+        by_path[comment.path] = comment
+        tree.append(comment)
+
+    return tree, next_after
@@ -0,0 +1,10 @@
+from django.db.models import Case, IntegerField, Value, When
+
+
+def delta_case(deltas, lookup):
+    """
+    CASE expression picking each row's delta out of {key: delta}, ``lookup`` maps a key to
+    When() kwargs. Lets one UPDATE add a different amount to every row it touches.
+    """
+    whens = [When(then=Value(delta), **lookup(key)) for key, delta in deltas.items()]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
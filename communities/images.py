@@ -0,0 +1,100 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction, connection
+from PIL import Image, ImageOps, ImageSequence
+
+logger = logging.getLogger('app_api')
+
+IMAGE_VARIANT_WIDTHS = getattr(settings, 'IMAGE_VARIANT_WIDTHS', (320, 640, 1080, 2048))
+IMAGE_VARIANT_QUALITY = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 2)
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image-variants')
+
+
+def attach_image(post, upload):
+    """
+    Point ``post`` at the content-addressed blob holding ``upload``, storing it only if it is new.
+
+    Call it in the transaction that saves ``post``, which holds the blob's lock against gc_image_blobs.
+    """
+    from communities.models import ImageBlob
+
+    blob = ImageBlob.objects.for_upload(upload)
+    post.image_blob = blob
+    post.image = blob.image.name
+    post.image_variants = blob.variants
+
+
+def schedule_variants(blob):
+    """Build the blob's image variants in the worker pool once the current transaction commits."""
+    blob_id = blob.id
+    transaction.on_commit(lambda: _executor.submit(build_variants_quietly, blob_id))
+
+
+def build_variants_quietly(blob_id):
+    from communities.models import ImageBlob
+
+    try:
+        blob = ImageBlob.objects.filter(id=blob_id).first()
+        if blob and not blob.variants:
+            build_variants(blob)
+    except Exception:
+        logger.exception(f'building image variants for image blob {blob_id} failed')
+    finally:
+        connection.close()  # worker threads hold their own connection
+
+
+def build_variants(blob):
+    """
+    Write resized WebP copies of ``blob.image`` next to it and record them on the blob and its posts.
+
+    The original is rotated by its EXIF orientation before resizing and the copies are saved
+    without any metadata, so feeds serving the variants never leak camera or location data.
+    Animated GIFs and WebPs get animated copies with every frame and its timing.
+    Returns the {width: name} mapping stored in ``variants``.
+    """
+    from communities.models import Post
+
+    name = blob.image.name
+    storage = blob.image.storage
+    with storage.open(name, 'rb') as f:
+        frames, save_options = read_frames(Image.open(f))
+    width, height = frames[0].size
+
+    stem = os.path.splitext(name)[0]
+    variants = {}
+    # images narrower than a width still get one copy at their own size, stripped and re-encoded
+    for variant_width in sorted({min(variant_width, width) for variant_width in IMAGE_VARIANT_WIDTHS}):
+        size = (variant_width, max(1, round(height * variant_width / width)))
+        resized = [frame if size == frame.size else frame.resize(size, Image.LANCZOS) for frame in frames]
+        buffer = io.BytesIO()
+        resized[0].save(buffer, 'WEBP', quality=IMAGE_VARIANT_QUALITY, method=4, append_images=resized[1:],
+                        **save_options)
+        variants[str(variant_width)] = storage.save(f'{stem}_{variant_width}w.webp', ContentFile(buffer.getvalue()))
+
+    blob.variants = variants
+    blob.save(update_fields=['variants'])
+    Post.objects.filter(image_blob=blob).update(image_variants=variants)
+    return variants
+
+
+def read_frames(image):
+    """The frames of an open image, ready to resize, and the WEBP save options keeping it animated."""
+    if getattr(image, 'is_animated', False):
+        frames, durations = [], []
+        for frame in ImageSequence.Iterator(image):
+            frames.append(frame.convert('RGBA'))
+            durations.append(frame.info.get('duration', 100))
+        return frames, {'save_all': True, 'duration': durations, 'loop': image.info.get('loop', 0)}
+
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return [image], {}
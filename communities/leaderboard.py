@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import CommunityMember
+
+LEADERBOARD_SIZE = getattr(settings, 'LEADERBOARD_SIZE', 25)
+# about the interval rollup_reputation runs at, so boards of a purged generation age out soon after
+LEADERBOARD_CACHE_TIMEOUT = getattr(settings, 'LEADERBOARD_CACHE_TIMEOUT', 5 * 60)
+# boards are cached at these sizes only and sliced to the limit asked for
+CACHED_SIZES = (10, 25, 50, 100)
+LEADERBOARD_MAX_SIZE = CACHED_SIZES[-1]
+GENERATION_KEY = 'leaderboard:generation'
+
+
+def purge_leaderboards(community_id=None):
+    """
+    Drop the cached leaderboards of a community, or of every community once reputation
+    rollups have changed community_rep.
+    """
+    if community_id is None:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+    else:
+        generation = cache.get(GENERATION_KEY, 0)
+        cache.delete_many([board_key(community_id, generation, size) for size in CACHED_SIZES])
+
+
+def board_key(community_id, generation, size):
+    return f'leaderboard:{community_id}:{generation}:{size}'
+
+
+def ranked_members(community):
+    # banned members keep their reputation but are left off the board
+    return CommunityMember.objects.filter(community=community, banned=False)
+
+
+def top_members(community, limit=LEADERBOARD_SIZE):
+    """
+    The ``limit`` members with the most community_rep, read off member_leaderboard_idx.
+
+    community_rep only changes when reputation is rolled up, so boards are cached until the
+    next rollup, or a ban in the community, purges them. Returns [(rank, username, community_rep)].
+    """
+    limit = max(1, min(limit, LEADERBOARD_MAX_SIZE))
+    size = next(size for size in CACHED_SIZES if size >= limit)
+    key = board_key(community.id, cache.get(GENERATION_KEY, 0), size)
+    board = cache.get(key)
+    if board is None:
+        rows = ranked_members(community).order_by('-community_rep', 'id').values_list(
+            'user__username', 'community_rep')[:size]
+        board = [(rank, username, rep) for rank, (username, rep) in enumerate(rows, start=1)]
+        cache.set(key, board, LEADERBOARD_CACHE_TIMEOUT)
+    return board[:limit]
+
+
+def member_rank(community, user):
+    """
+    The user's 1-based rank on the community's leaderboard and their community_rep, or None
+    if they are not on it. Ties are broken by membership age, as on the board.
+    """
+    member = ranked_members(community).filter(user=user).values_list('id', 'community_rep').first()
+    if member is None:
+        return None
+    member_id, rep = member
+    # an index range count of the members above, no sort of the community
+    above = ranked_members(community).filter(Q(community_rep__gt=rep) | Q(community_rep=rep, id__lt=member_id)).count()
+    return above + 1, rep
@@ -0,0 +1,258 @@
+import asyncio
+import io
+import json
+import logging
+import threading
+from collections import defaultdict
+from importlib import import_module
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('app_api')
+
+LIVE_COALESCE_MS = getattr(settings, 'LIVE_COALESCE_MS', 250)
+LIVE_KEEPALIVE_SECONDS = getattr(settings, 'LIVE_KEEPALIVE_SECONDS', 25)
+LIVE_QUEUE_SIZE = getattr(settings, 'LIVE_QUEUE_SIZE', 100)
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def community_channel(community_id):
+    return f'community:{community_id}'
+
+
+class Subscription:
+    """
+    One connected stream: a bounded queue owned by the event loop serving it. ``origin`` is
+    the id the page also sends with its votes, so they are not echoed back to it.
+    """
+
+    def __init__(self, channels, origin=None):
+        self.channels = channels
+        self.origin = origin
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+
+    def deliver(self, event):
+        # publishers run in request threads, the queue may only be touched from its loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass  # a stalled client misses events instead of growing the queue, a reload catches it up
+
+
+class InProcessHub:
+    """
+    Broadcast hub for the streams connected to this process.
+
+    Vote deltas are summed per channel and sent every LIVE_COALESCE_MS as one event, so a
+    post taking hundreds of votes a second costs each viewer a few small messages. The
+    deltas of votes cast with an origin are also listed per origin and taken out again for
+    the stream of that origin, whose page already counted them. Each
+    worker process has its own hub; with several workers LIVE_HUB_BACKEND names a subclass
+    whose publish() sends through a shared pub/sub and which calls deliver() for every
+    message it receives.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._pending_votes = defaultdict(lambda: defaultdict(int))  # channel -> (kind, id) -> rep delta
+        self._pending_origins = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))  # channel -> origin -> ...
+        self._flush_timer = None
+
+    def subscribe(self, channels, origin=None):
+        subscription = Subscription(channels, origin)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        self.deliver(channel, event)
+
+    def deliver(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            if event['type'] == 'votes':
+                own_event = without_origin(event, subscription.origin)
+                if own_event['posts'] or own_event['comments']:
+                    subscription.deliver(own_event)
+            else:
+                subscription.deliver(event)
+
+    def publish_vote(self, channels, kind, object_id, delta, origin=None):
+        with self._lock:
+            for channel in channels:
+                self._pending_votes[channel][(kind, object_id)] += delta
+                if origin:
+                    self._pending_origins[channel][origin][(kind, object_id)] += delta
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(LIVE_COALESCE_MS / 1000, self.flush_votes)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush_votes(self):
+        with self._lock:
+            pending, origins = self._pending_votes, self._pending_origins
+            self._pending_votes = defaultdict(lambda: defaultdict(int))
+            self._pending_origins = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+            self._flush_timer = None
+
+        for channel, deltas in pending.items():
+            event = {'type': 'votes', **vote_deltas(deltas), 'origins': {
+                origin: vote_deltas(origin_deltas) for origin, origin_deltas in origins[channel].items()}}
+            if event['posts'] or event['comments'] or event['origins']:
+                self.publish(channel, event)
+
+
+def vote_deltas(deltas):
+    """{'posts': {id: delta}, 'comments': {id: delta}} of the nonzero (kind, id) -> delta."""
+    grouped = {'posts': {}, 'comments': {}}
+    for (kind, object_id), delta in deltas.items():
+        if delta:
+            grouped['posts' if kind == 'post' else 'comments'][object_id] = delta
+    return grouped
+
+
+def without_origin(event, origin):
+    """The votes event as the stream of ``origin`` gets it: less its own votes, without the origins."""
+    own = event.get('origins', {}).get(origin, {})
+    stripped = {'type': 'votes'}
+    for key in ('posts', 'comments'):
+        # pub/sub backends may hand ids back as json strings, so both sides are keyed by str
+        deltas = {str(object_id): delta for object_id, delta in event[key].items()}
+        for object_id, delta in own.get(key, {}).items():
+            deltas[str(object_id)] = deltas.get(str(object_id), 0) - delta
+        stripped[key] = {object_id: delta for object_id, delta in deltas.items() if delta}
+    return stripped
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = import_string(getattr(settings, 'LIVE_HUB_BACKEND', 'communities.live.InProcessHub'))()
+    return _hub
+
+
+def publish_vote(post, post_comment, delta, origin=None):
+    if post_comment:
+        get_hub().publish_vote([post_channel(post.id)], 'comment', post_comment.id, delta, origin)
+    else:
+        get_hub().publish_vote([post_channel(post.id), community_channel(post.community_id)], 'post', post.id,
+                               delta, origin)
+
+
+def publish_comment(comment):
+    # rendered once without a viewer, so no vote arrow is active and no edit link is shown
+    comment.refresh_from_db(fields=['like_count', 'dislike_count'])  # picks up the author's own upvote
+    comment.user_vote = None
+    html = render_to_string('communities/comment-card.html', {'post_comment': comment})
+    hub = get_hub()
+    hub.publish(post_channel(comment.post_id), {'type': 'comment', 'id': comment.id, 'post_id': comment.post_id,
+                                                'parent_id': comment.parent_comment_id, 'html': html})
+    hub.publish(community_channel(comment.community_id), {'type': 'comment', 'post_id': comment.post_id})
+
+
+def live_stream(request, *args, **kwargs):
+    # the stream is served by live_stream_app, which mors_tyrannis.asgi routes these urls to
+    return HttpResponse('Live updates need the ASGI server.', status=501)
+
+
+@sync_to_async
+def authorize(scope, community_slug, post_id=None):
+    from communities.models import Community, Post
+
+    close_old_connections()
+    try:
+        request = ASGIRequest(scope, io.BytesIO())
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        community = Community.objects.filter(slug=community_slug).first()
+        if community is None or not community.has_access(get_user(request)):
+            return None
+        if post_id is None:
+            return [community_channel(community.id)]
+        if not Post.objects.filter(id=post_id, community=community).exists():
+            return None
+        return [post_channel(post_id)]
+    finally:
+        close_old_connections()
+
+
+async def live_stream_app(scope, receive, send, community_slug, post_id=None):
+    """Server-sent event stream of a community's or a post's votes and comments."""
+    channels = await authorize(scope, community_slug, post_id)
+    if channels is None:
+        await send({'type': 'http.response.start', 'status': 403, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    origin = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('origin', [''])[0][:64] or None
+    hub = get_hub()
+    subscription = hub.subscribe(channels, origin)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        while True:
+            event = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({event, disconnected}, timeout=LIVE_KEEPALIVE_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                event.cancel()
+                break
+            if event in done:
+                body = format_event(event.result())
+            else:
+                event.cancel()
+                body = b': keepalive\n\n'  # keeps proxies from closing an idle stream
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    except OSError:
+        logger.info(f'live stream for {channels} closed by the client')
+    finally:
+        hub.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def format_event(event):
+    return f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'.encode()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from communities.models import CommunityMember, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Fill home timelines from followed communities and cap them at HOME_TIMELINE_LENGTH entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trim-only', action='store_true', help='only drop entries beyond the cap')
+
+    def handle(self, *args, **options):
+        if options['trim_only']:
+            users = get_user_model().objects.filter(timelineentry__isnull=False).distinct()
+            count = 0
+            for count, user in enumerate(users.iterator(), start=1):
+                TimelineEntry.objects.trim(user)
+            self.stdout.write(self.style.SUCCESS(f'Trimmed {count} timelines.'))
+            return
+
+        follows = CommunityMember.objects.filter(following=True).select_related('user', 'community').iterator()
+        count = 0
+        for count, member in enumerate(follows, start=1):
+            TimelineEntry.objects.backfill(member.user, member.community)
+        self.stdout.write(self.style.SUCCESS(f'Backfilled timelines for {count} follows.'))
@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.middleware.csrf import CSRF_ALLOWED_CHARS
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from communities.models import Community, CommunityMember, Post
+
+QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # like the test client, time the request itself and not the page it redirects to
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Measure p50/p99 latency and query counts of the main pages, votes and comments through the '
+            'test client and over HTTP, and compare them with a stored baseline. Votes and comments are '
+            'really written, run it against generate_synthetic_data output.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('client', 'http', 'both'), default='client')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='running server for --mode http')
+        parser.add_argument('--iterations', type=int, default=50, help='requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='parallel requests in http mode')
+        parser.add_argument('--community', help='slug to benchmark, defaults to the one with the most posts')
+        parser.add_argument('--username', help='user to log in as, defaults to a member of the community')
+        parser.add_argument('--baseline', default='benchmark-baseline.json')
+        parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='allowed p99 slowdown over the baseline, as a fraction')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        community, post, user = self.pick_targets(options['community'], options['username'])
+        endpoints = self.endpoints(community, post)
+        modes = ('client', 'http') if options['mode'] == 'both' else (options['mode'],)
+
+        results = {}
+        for mode in modes:
+            if mode == 'client':
+                results[mode] = self.run_client(endpoints, user, options['iterations'])
+            else:
+                results[mode] = self.run_http(endpoints, user, options['url'], options['iterations'],
+                                              options['concurrency'])
+
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        regressions = self.report(results, baseline, options['tolerance'])
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Saved baseline to {options["baseline"]}.'))
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} endpoints regressed: {", ".join(regressions)}')
+
+    def pick_targets(self, slug, username):
+        communities = Community.objects.filter(is_private=False, require_join_approval=False)
+        if slug:
+            communities = Community.objects.filter(slug=slug)
+        community = communities.annotate(posts=Count('post')).order_by('-posts').first()
+        if community is None:
+            raise CommandError('No community to benchmark, run generate_synthetic_data first.')
+        post = Post.objects.filter(community=community).order_by('-comment_count', '-id').first()
+        if post is None:
+            raise CommandError(f'{community.slug} has no posts.')
+
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            member = CommunityMember.objects.filter(community=community, following=True, banned=False).first()
+            user = member.user if member else None
+        if user is None:
+            raise CommandError('No user to log in as, pass --username.')
+        return community, post, user
+
+    @staticmethod
+    def endpoints(community, post):
+        """(name, method, path, data, logged_in) of every benchmarked request."""
+        post_kwargs = {'community_slug': community.slug, 'post_id': post.id}
+        return [
+            ('front page (anonymous)', 'GET', reverse('base:index'), None, False),
+            ('front page', 'GET', reverse('base:index'), None, True),
+            ('community page', 'GET', reverse('communities:detail', args=[community.slug]), None, True),
+            ('post view', 'GET', reverse('communities:view-post', kwargs=post_kwargs), None, True),
+            ('vote toggle', 'POST', reverse('communities:upvote-post', kwargs=post_kwargs), {}, True),
+            ('add comment', 'POST', reverse('communities:post-add-comment', kwargs=post_kwargs),
+             {'content': 'Benchmark comment'}, True),
+        ]
+
+    def run_client(self, endpoints, user, iterations):
+        setup_test_environment()
+        anonymous, logged_in = Client(), Client()
+        logged_in.force_login(user)
+
+        results = {}
+        for name, method, path, data, login in endpoints:
+            client = logged_in if login else anonymous
+            timings, queries = [], []
+            for _ in range(iterations):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.post(path, data) if method == 'POST' else client.get(path)
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    raise CommandError(f'{name}: {method} {path} answered {response.status_code}')
+            results[name] = self.summarize(timings, queries)
+        return results
+
+    def run_http(self, endpoints, user, base_url, iterations, concurrency):
+        # a session shared through the database, and a csrf token the server accepts from cookie and header alike
+        client = Client()
+        client.force_login(user)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        csrf_token = get_random_string(32, CSRF_ALLOWED_CHARS)
+        opener = urllib.request.build_opener(NoRedirect)
+
+        def request(method, path, data, login):
+            headers = {}
+            if login:
+                headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={csrf_token}'
+                headers['X-CSRFToken'] = csrf_token
+            body = None
+            if method == 'POST':
+                body = '&'.join(f'{key}={urllib.request.quote(value)}' for key, value in data.items()).encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            req = urllib.request.Request(base_url.rstrip('/') + path, data=body, headers=headers, method=method)
+            start = time.perf_counter()
+            try:
+                with opener.open(req) as response:
+                    response.read()
+                    status, timing = response.status, response.headers.get('Server-Timing', '')
+            except urllib.error.HTTPError as e:
+                status, timing = e.code, e.headers.get('Server-Timing', '')
+            elapsed = (time.perf_counter() - start) * 1000
+            match = QUERIES_RE.search(timing)
+            return status, elapsed, int(match.group(1)) if match else None
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for name, method, path, data, login in endpoints:
+                responses = list(executor.map(lambda _: request(method, path, data, login), range(iterations)))
+                # under load failures are part of the result, e.g. sqlite refusing concurrent writers
+                ok = [(elapsed, count) for status, elapsed, count in responses if status < 400]
+                if not ok:
+                    raise CommandError(f'{name}: every {method} {path} failed, answering {responses[0][0]}')
+                # query counts come from RequestMetricsMiddleware's Server-Timing header when it is installed
+                queries = [count for _, count in ok if count is not None]
+                results[name] = self.summarize([elapsed for elapsed, _ in ok], queries, len(responses) - len(ok))
+        return results
+
+    @staticmethod
+    def summarize(timings, queries, errors=0):
+        return {
+            'requests': len(timings) + errors,
+            'errors': errors,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'avg_queries': round(sum(queries) / len(queries), 2) if queries else None,
+            'max_queries': max(queries) if queries else None,
+        }
+
+    def report(self, results, baseline, tolerance):
+        """Print every endpoint next to its baseline and return the names of those that regressed."""
+        regressions = []
+        for mode, endpoints in results.items():
+            self.stdout.write(f'\n{mode}:')
+            self.stdout.write(f'{"endpoint":<24}{"p50 ms":>10}{"p99 ms":>10}{"queries":>10}{"max":>6}{"errors":>8}'
+                              f'  baseline')
+            for name, result in endpoints.items():
+                line = (f'{name:<24}{result["p50_ms"]:>10.1f}{result["p99_ms"]:>10.1f}'
+                        f'{result["avg_queries"] if result["avg_queries"] is not None else "-":>10}'
+                        f'{result["max_queries"] if result["max_queries"] is not None else "-":>6}'
+                        f'{result["errors"]:>8}')
+                previous = baseline.get(mode, {}).get(name)
+                if previous is None:
+                    self.stdout.write(f'{line}  none')
+                    continue
+
+                slower = result['p99_ms'] > previous['p99_ms'] * (1 + tolerance)
+                more_queries = (result['max_queries'] is not None and previous['max_queries'] is not None
+                                and result['max_queries'] > previous['max_queries'])
+                more_errors = result['errors'] > previous.get('errors', 0)
+                comparison = f'p99 {previous["p99_ms"]:.1f}ms, max {previous["max_queries"]} queries'
+                if slower or more_queries or more_errors:
+                    regressions.append(f'{mode} {name}')
+                    self.stdout.write(self.style.ERROR(f'{line}  REGRESSED, was {comparison}'))
+                else:
+                    self.stdout.write(f'{line}  ok, was {comparison}')
+        return regressions
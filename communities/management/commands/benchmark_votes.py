@@ -0,0 +1,69 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from django.test.utils import override_settings
+
+from communities.models import Community, Post, PostCommentLike
+from communities.voting.vote_buffer import vote_buffer
+from communities.voting.vote_functions import toggle_upvote, toggle_downvote
+from users.models import UserMeta
+
+
+class Command(BaseCommand):
+    help = 'Compare vote throughput on a single hot post with and without the write-behind vote buffer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=50)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--rounds', type=int, default=4, help='votes cast by each voter')
+        parser.add_argument('--flush-ms', type=int, default=200)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([User(username=f'vote-bench-{tag}-{i}') for i in range(options['voters'] + 1)])
+        users = list(User.objects.filter(username__startswith=f'vote-bench-{tag}-'))
+        UserMeta.objects.bulk_create([UserMeta(user=user) for user in users])
+        author, voters = users[0], users[1:]
+        community = Community.objects.create(name=f'vote-bench-{tag}', description='vote benchmark')
+
+        try:
+            for label, buffered in (('direct', False), ('buffered', True)):
+                post = Post.objects.create(community=community, user=author, title=label, post_type='text')
+                with override_settings(VOTE_BUFFER_ENABLED=buffered, VOTE_BUFFER_FLUSH_MS=options['flush_ms']):
+                    elapsed, failed = self.run_votes(post, voters, options['threads'], options['rounds'])
+                    vote_buffer.flush()
+
+                post.refresh_from_db()
+                likes = PostCommentLike.objects.filter(post=post)
+                consistent = (post.like_count == likes.filter(upvote=True).count()
+                              and post.dislike_count == likes.filter(upvote=False).count())
+                votes = len(voters) * options['rounds'] - failed
+                self.stdout.write(f'{label:>8}: {votes} votes in {elapsed:.2f}s ({votes / elapsed:.0f} votes/s), '
+                                  f'{failed} failed, counters consistent: {consistent}')
+        finally:
+            community.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    @staticmethod
+    def run_votes(post, voters, threads, rounds):
+        def vote(voter):
+            failed = 0
+            try:
+                for i in range(rounds):
+                    try:
+                        (toggle_upvote if i % 3 else toggle_downvote)(voting_user=voter, post=post)
+                    except OperationalError:
+                        # sqlite refuses concurrent writers instead of queueing them, use --threads 1 there
+                        failed += 1
+            finally:
+                connection.close()
+            return failed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            failed = sum(executor.map(vote, voters))
+        return time.perf_counter() - start, failed
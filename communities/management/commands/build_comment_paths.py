@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from communities.models import PostComment, COMMENT_MAX_DEPTH, COMMENT_PATH_STEP, path_ancestor_id
+
+
+class Command(BaseCommand):
+    help = 'Fill PostComment.path and depth for comments created before threads were stored as paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # parents always have lower ids than their replies, so id order builds every parent first
+        pending = PostComment.objects.filter(path='').order_by('id').values_list('id', 'parent_comment_id')
+        built = {}
+        batch = []
+        count = 0
+        for comment_id, parent_id in pending.iterator():
+            parent_path, parent_depth = '', -1
+            if parent_id:
+                if parent_id not in built:
+                    built[parent_id] = PostComment.objects.values_list('path', 'depth').get(id=parent_id)
+                parent_path, parent_depth = built[parent_id]
+                if parent_depth >= COMMENT_MAX_DEPTH:
+                    # too deep for the path column, moved up like PostComment.save does for new replies
+                    parent_id = path_ancestor_id(parent_path, COMMENT_MAX_DEPTH - 1)
+                    parent_path, parent_depth = parent_path[:COMMENT_MAX_DEPTH * COMMENT_PATH_STEP], COMMENT_MAX_DEPTH - 1
+
+            built[comment_id] = (parent_path + str(comment_id).zfill(COMMENT_PATH_STEP), parent_depth + 1)
+            batch.append(PostComment(id=comment_id, parent_comment_id=parent_id, path=built[comment_id][0],
+                                     depth=built[comment_id][1]))
+
+            if len(batch) >= options['batch_size']:
+                count += PostComment.objects.bulk_update(batch, ['parent_comment', 'path', 'depth'])
+                batch = []
+
+        if batch:
+            count += PostComment.objects.bulk_update(batch, ['parent_comment', 'path', 'depth'])
+
+        self.stdout.write(self.style.SUCCESS(f'Built paths for {count} comments.'))
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from communities.models import Community, CommunityMember
+
+
+class Command(BaseCommand):
+    help = 'Make users follow, or with --unfollow stop following, a community in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('community', help='slug of the community')
+        parser.add_argument('usernames', nargs='*')
+        parser.add_argument('--all-users', action='store_true', help='every active user instead of usernames')
+        parser.add_argument('--unfollow', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        community = Community.objects.filter(slug=options['community']).first()
+        if community is None:
+            raise CommandError(f'No community with slug {options["community"]}.')
+        if options['all_users'] == bool(options['usernames']):
+            raise CommandError('Pass either usernames or --all-users.')
+
+        users = get_user_model().objects.filter(is_active=True)
+        if not options['all_users']:
+            users = users.filter(username__in=options['usernames'])
+        user_ids = list(users.order_by('id').values_list('id', flat=True))
+
+        count = 0
+        for start in range(0, len(user_ids), options['batch_size']):
+            batch = user_ids[start:start + options['batch_size']]
+            if options['unfollow']:
+                count += CommunityMember.objects.remove_followers(community, batch)
+            else:
+                count += len(CommunityMember.objects.add_followers(community, batch))
+
+        action = 'stopped following' if options['unfollow'] else 'now follow'
+        self.stdout.write(self.style.SUCCESS(f'{count} users {action} {community.slug}.'))
@@ -0,0 +1,56 @@
+from datetime import timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from communities.models import ImageBlob, Post
+
+
+class Command(BaseCommand):
+    help = 'Delete image blobs, and their files, that no post refers to any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='keep recent blobs, their post may still be being written')
+        parser.add_argument('--recount', action='store_true', help='recompute every ref_count from the posts first')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            fixed = 0
+            for blob in ImageBlob.objects.annotate(refs=Count('posts')).iterator():
+                if blob.ref_count != blob.refs:
+                    ImageBlob.objects.filter(id=blob.id).update(ref_count=blob.refs)
+                    fixed += 1
+            self.stdout.write(f'Corrected {fixed} reference counts.')
+
+        # ref_count picks the candidates cheaply, the Exists guards against a count that drifted low
+        unreferenced = ImageBlob.objects.filter(ref_count__lte=0).exclude(
+            Exists(Post.objects.filter(image_blob=OuterRef('pk'))))
+        candidates = unreferenced.filter(created_at__lt=timezone.now() - timedelta(hours=options['grace_hours']))
+
+        deleted = 0
+        for blob_id in candidates.values_list('id', flat=True).iterator():
+            if options['dry_run']:
+                deleted += 1
+                continue
+            with transaction.atomic():
+                # an upload may have found the blob by its hash since, so check again with the row locked
+                blob = unreferenced.select_for_update().filter(id=blob_id).first()
+                if blob is None:
+                    continue
+                blob.delete()
+                names = [blob.image.name, *blob.variants.values()]
+                transaction.on_commit(partial(delete_files, blob.image.storage, names))
+            deleted += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{"Would delete" if options["dry_run"] else "Deleted"} '
+                                             f'{deleted} unreferenced image blobs.'))
+
+
+def delete_files(storage, names):
+    for name in names:
+        storage.delete(name)
@@ -0,0 +1,137 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.text import slugify
+
+from communities.models import Community, CommunityMember, Post, PostComment, PostCommentLike
+from users.models import UserMeta
+
+WORDS = ('tyrant', 'meme', 'cat', 'news', 'update', 'question', 'photo', 'rant', 'guide', 'review', 'build',
+         'first', 'weekly', 'thread', 'help', 'idea', 'launch', 'bug', 'story', 'map', 'game', 'city', 'art')
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with synthetic communities, members, posts, comment threads and votes, '
+            'skewed like real traffic, for benchmark_endpoints.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='synth', help='prefix of every generated username and community')
+        parser.add_argument('--communities', type=int, default=20)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--votes', type=int, default=50000)
+        parser.add_argument('--max-depth', type=int, default=10, help='deepest reply chain in a thread')
+        parser.add_argument('--days', type=int, default=30, help='spread post creation over this many days')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+
+        users = self.create_users(prefix, options['users'])
+        communities = self.create_communities(prefix, options['communities'])
+        self.create_members(communities, users)
+        posts = self.create_posts(communities, users, options['posts'], options['days'])
+        comment_count = self.create_comments(posts, users, options['comments'], options['max_depth'])
+        vote_count = self.create_votes(posts, users, options['votes'])
+
+        # the denormalized columns are rebuilt the way they are repaired in production
+        call_command('build_comment_paths', batch_size=self.batch_size, stdout=self.stdout)
+        call_command('recount_comments', stdout=self.stdout)
+        self.recount_votes(posts)
+        call_command('recompute_reputation', stdout=self.stdout)
+        call_command('refresh_post_scores', rebuild=True, batch_size=self.batch_size, stdout=self.stdout)
+        call_command('backfill_timelines', stdout=self.stdout)
+        call_command('rebuild_search_index', batch_size=self.batch_size, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(users)} users, {len(communities)} communities, {len(posts)} posts, '
+            f'{comment_count} comments and {vote_count} votes with prefix "{prefix}".'))
+
+    def skewed(self, items, count, exponent=1.1):
+        """``count`` picks from ``items``, the first items picked far more often (zipf-like)."""
+        weights = [1 / (rank + 1) ** exponent for rank in range(len(items))]
+        return self.rng.choices(items, weights=weights, k=count)
+
+    def create_users(self, prefix, count):
+        User.objects.bulk_create([User(username=f'{prefix}-user-{i}') for i in range(count)],
+                                 batch_size=self.batch_size)
+        users = list(User.objects.filter(username__startswith=f'{prefix}-user-').order_by('id'))
+        UserMeta.objects.bulk_create([UserMeta(user=user) for user in users], batch_size=self.batch_size,
+                                     ignore_conflicts=True)
+        return users
+
+    def create_communities(self, prefix, count):
+        communities = []
+        for i in range(count):
+            name = f'{prefix} {self.rng.choice(WORDS)} {i}'
+            communities.append(Community(name=name, slug=slugify(name), description=f'Synthetic community {i}',
+                                         auto_follow=i < 3, require_join_approval=i % 10 == 9))
+        Community.objects.bulk_create(communities, batch_size=self.batch_size)
+        return list(Community.objects.filter(name__startswith=f'{prefix} ').order_by('id'))
+
+    def create_members(self, communities, users):
+        members = set()
+        for user in users:
+            # most users follow a few communities, the first ones are the big ones
+            for community in self.skewed(communities, self.rng.randint(1, 8)):
+                members.add((community.id, user.id))
+        CommunityMember.objects.bulk_create([CommunityMember(community_id=c, user_id=u, following=True)
+                                             for c, u in members], batch_size=self.batch_size,
+                                            ignore_conflicts=True)
+
+    def create_posts(self, communities, users, count, days):
+        posts = [Post(community=community, user=self.rng.choice(users), title=f'{self.rng.choice(WORDS)} '
+                      f'{self.rng.choice(WORDS)} {i}', content='Lorem ipsum dolor sit amet. ' * self.rng.randint(1, 20),
+                      post_type='text')
+                 for i, community in enumerate(self.skewed(communities, count))]
+        posts = Post.objects.bulk_create(posts, batch_size=self.batch_size)
+
+        # auto_now_add ignores given values on insert, so the spread is written afterwards
+        now = timezone.now()
+        for post in posts:
+            post.created_at = now - timedelta(seconds=self.rng.randint(0, days * 86400))
+        Post.objects.bulk_update(posts, ['created_at'], batch_size=self.batch_size)
+        return posts
+
+    def create_comments(self, posts, users, count, max_depth):
+        # a few posts get most comments; they are inserted in rounds so later ones can reply to earlier ones
+        targets = self.skewed(posts, count)
+        round_size = -(-count // (max_depth + 1))
+        previous = {}
+        for start in range(0, count, round_size):
+            comments = []
+            for post in targets[start:start + round_size]:
+                parents = previous.get(post.id)
+                parent = self.rng.choice(parents) if parents and self.rng.random() < 0.7 else None
+                comments.append(PostComment(post=post, community_id=post.community_id, user=self.rng.choice(users),
+                                            parent_comment=parent, content='Replying. ' * self.rng.randint(1, 10)))
+            previous = {}
+            for comment in PostComment.objects.bulk_create(comments, batch_size=self.batch_size):
+                previous.setdefault(comment.post_id, []).append(comment)
+        return len(targets)
+
+    def create_votes(self, posts, users, count):
+        votes = {}
+        for post in self.skewed(posts, count):
+            votes[(self.rng.choice(users).id, post.id)] = (post, self.rng.random() < 0.8)
+        PostCommentLike.objects.bulk_create([PostCommentLike(user_id=user_id, post=post, upvote=upvote)
+                                             for (user_id, _), (post, upvote) in votes.items()],
+                                            batch_size=self.batch_size, ignore_conflicts=True)
+        return len(votes)
+
+    def recount_votes(self, posts):
+        likes = PostCommentLike.objects.filter(post=OuterRef('pk'), post_comment=None).order_by().values('post')
+        count = lambda upvote: Coalesce(Subquery(likes.filter(upvote=upvote).annotate(total=Count('id')).values('total'),
+                                                 output_field=IntegerField()), 0)
+        Post.objects.filter(id__in=[post.id for post in posts]).update(like_count=count(True),
+                                                                       dislike_count=count(False))
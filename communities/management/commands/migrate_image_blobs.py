@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from communities.images import attach_image
+from communities.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Move image posts stored under post_images/ onto shared content-addressed image blobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='delete each old file once no post refers to it')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(image_blob=None).exclude(image='').exclude(image=None).order_by('id')
+        migrated = 0
+        for post in posts.iterator():
+            old_image, old_variants = post.image, post.image_variants
+            try:
+                old_image.open('rb')
+            except FileNotFoundError:
+                self.stderr.write(f'post {post.id}: {old_image.name} is missing')
+                continue
+
+            with old_image, transaction.atomic():
+                attach_image(post, old_image)
+                post.save(update_fields=['image', 'image_blob', 'image_variants'])
+            migrated += 1
+
+            # posts sharing a file since upload hashing share its variants too
+            if options['delete_originals'] and not Post.objects.filter(image=old_image.name).exists():
+                for name in [old_image.name, *old_variants.values()]:
+                    old_image.storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {migrated} posts onto image blobs, '
+                                             f'run build_image_variants for their variants.'))
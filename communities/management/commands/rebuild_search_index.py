@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from communities.models import SearchIndexEntry
+from communities.search import INDEXED, document_terms
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the search index from the posts, comments and communities, e.g. to fill it for rows '
+            'written before it existed or by bulk inserts, which skip the signals keeping it current.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(INDEXED), action='append',
+                            help='only rebuild this kind, may be repeated')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for kind in options['kind'] or INDEXED:
+            model, fields, _ = INDEXED[kind]
+            fields = [field for field, _ in fields]
+            community_field = 'id' if kind == SearchIndexEntry.COMMUNITY else 'community_id'
+            last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+            indexed = 0
+            for start in range(0, last_id, batch_size):
+                end = start + batch_size
+                objects = model.objects.filter(id__gt=start, id__lte=end).only('id', community_field, *fields)
+                # each id range is swapped in one transaction, so searches never see it half built
+                with transaction.atomic():
+                    SearchIndexEntry.objects.filter(kind=kind, object_id__gt=start, object_id__lte=end).delete()
+                    entries = []
+                    for obj in objects:
+                        entries += [SearchIndexEntry(term=term, kind=kind, object_id=obj.id, weight=weight,
+                                                     community_id=getattr(obj, community_field))
+                                    for term, weight in document_terms(kind, obj).items()]
+                        indexed += 1
+                    SearchIndexEntry.objects.bulk_create(entries, batch_size=batch_size)
+            SearchIndexEntry.objects.filter(kind=kind, object_id__gt=last_id).delete()
+
+            self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} {model._meta.verbose_name_plural}.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from communities.reputation import REPUTATION_SETTLE_SECONDS, recompute_reputation
+
+
+class Command(BaseCommand):
+    help = ('Rebuild every community and user reputation from the votes, e.g. after drift or for data loaded in '
+            'bulk. Safe while votes come in: votes younger than --settle-seconds are left to the next '
+            'rollup_reputation runs, which must keep running to fold them in.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle-seconds', type=int, default=REPUTATION_SETTLE_SECONDS,
+                            help='leave the events of votes younger than this to rollup_reputation')
+
+    def handle(self, *args, **options):
+        authors = recompute_reputation(settle_seconds=options['settle_seconds'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed reputation from the votes of {authors} authors.'))
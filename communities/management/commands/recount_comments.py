@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+from communities.models import Post, PostComment
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post.comment_count for every post to repair drift from the stored counter.'
+
+    def handle(self, *args, **options):
+        actual = PostComment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+            total=Count('id')).values('total')
+        actual_count = Coalesce(Subquery(actual, output_field=IntegerField()), 0)
+
+        drifted = Post.objects.annotate(actual=actual_count).exclude(comment_count=F('actual')).count()
+        updated = Post.objects.update(comment_count=actual_count)
+
+        self.stdout.write(self.style.SUCCESS(f'Recounted comments for {updated} posts ({drifted} had drifted).'))
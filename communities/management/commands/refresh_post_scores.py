@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max
+
+from communities.models import Post
+from communities.ranking import hot_score, vote_weight
+
+
+class Command(BaseCommand):
+    help = 'Resync Post.score and Post.hot_score with the like counters. Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rebuild', action='store_true',
+                            help='recompute hot scores from created_at as well, e.g. to backfill existing posts')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Post.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            posts = Post.objects.filter(id__gt=start, id__lte=start + batch_size)
+            if options['rebuild']:
+                updated += self.rebuild(posts)
+            else:
+                # keeps the stored time term and swaps in the weight of the current counters in one statement,
+                # so votes landing meanwhile are not overwritten
+                updated += posts.exclude(score=F('like_count') - F('dislike_count')).update(
+                    score=F('like_count') - F('dislike_count'),
+                    hot_score=F('hot_score') - vote_weight(F('score')) + vote_weight(F('like_count') - F('dislike_count')),
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Refreshed scores for {updated} posts.'))
+
+    @staticmethod
+    def rebuild(posts):
+        posts = list(posts.only('id', 'like_count', 'dislike_count', 'created_at'))
+        for post in posts:
+            post.score = post.like_count - post.dislike_count
+            post.hot_score = hot_score(post.score, post.created_at)
+        return Post.objects.bulk_update(posts, ['score', 'hot_score'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from communities.reputation import REPUTATION_SETTLE_SECONDS, rollup_reputation
+
+
+class Command(BaseCommand):
+    help = 'Fold new reputation events into community and user reputation. Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle-seconds', type=int, default=REPUTATION_SETTLE_SECONDS,
+                            help='leave events younger than this for the next run')
+
+    def handle(self, *args, **options):
+        count = rollup_reputation(settle_seconds=options['settle_seconds'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {count} reputation events.'))
@@ -1,14 +1,43 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.utils.text import slugify
 from django.shortcuts import reverse
 from django.conf import settings
 from django.db.models import F
+from django.utils import timezone
 
+from .ranking import hot_score
+from .voting.vote_buffer import vote_buffer
+
+import hashlib
 import logging
+import os
 import re
 
 logger = logging.getLogger('app_api')
 
+HOME_TIMELINE_LENGTH = getattr(settings, 'HOME_TIMELINE_LENGTH', 500)
+HOME_TIMELINE_FANOUT_MAX_FOLLOWERS = getattr(settings, 'HOME_TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+COMMENT_PATH_STEP = 10  # digits per level of PostComment.path
+COMMENT_PATH_MAX_LENGTH = 1000
+# the deepest reply the path column has room for, replies to it join the thread at this depth
+COMMENT_MAX_DEPTH = COMMENT_PATH_MAX_LENGTH // COMMENT_PATH_STEP - 1
+
+
+def path_ancestor_id(path, depth):
+    """The id of the comment at ``depth`` on a PostComment.path."""
+    return int(path[depth * COMMENT_PATH_STEP:(depth + 1) * COMMENT_PATH_STEP])
+
+
+class CommunityManager(models.Manager):
+    def accessible_to(self, user):
+        """The communities Community.has_access lets ``user`` read, as one queryset."""
+        if user.is_anonymous:
+            return self.filter(require_join_approval=False)
+        return self.filter(models.Q(require_join_approval=False)
+                           | models.Q(id__in=CommunityMember.objects.filter(user=user).values('community'))
+                           | models.Q(id__in=CommunityJoinRequest.objects.filter(user=user, is_approved=True)
+                                      .values('community')))
+
 
 # Create your models here.
 class Community(models.Model):
@@ -21,10 +50,13 @@ class Community(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
 
     auto_follow = models.BooleanField(default=False)  # automatically follow this community on account creation
+    fanout_on_read = models.BooleanField(default=False)  # too many followers to copy posts into home timelines
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommunityManager()
+
     class Meta:
         verbose_name_plural = 'communities'
 
@@ -34,6 +66,16 @@ class Community(models.Model):
     def get_absolute_url(self):
         return reverse('community_detail', kwargs={'slug': self.slug})
 
+    def get_membership(self, user):
+        """The user's CommunityMember row here, or None. Loaded once per request, see membership_cache."""
+        if not user.is_authenticated:
+            return None
+
+        memberships = membership_cache(user)
+        if self.id not in memberships:
+            memberships[self.id] = CommunityMember.objects.filter(community=self, user=user).first()
+        return memberships[self.id]
+
     def has_access(self, user):
         if self.require_join_approval:
             if user.is_anonymous:
@@ -44,47 +86,47 @@ class Community(models.Model):
         return True
 
     def is_member(self, user):
-        if user.is_authenticated:
-            return CommunityMember.objects.filter(community=self, user=user).exists()
-        return False
+        return self.get_membership(user) is not None
 
     def is_admin(self, user):
-        if user.is_authenticated:
-            return CommunityMember.objects.filter(community=self, user=user, is_admin=True).exists()
+        member = self.get_membership(user)
+        return member is not None and member.is_admin
 
     def is_follower(self, user):
-        if user.is_authenticated:
-            return CommunityMember.objects.filter(community=self, user=user, following=True).exists()
-        return False
+        member = self.get_membership(user)
+        return member is not None and member.following
 
     def add_member(self, user):
         if not self.is_member(user):
             member = CommunityMember.objects.create(community=self, user=user)
-            member.save()
+            membership_cache(user)[self.id] = member
             return True
         return False
 
     def add_follower(self, user):
-        if not self.is_member(user):
+        member = self.get_membership(user)
+        if member is None:
             member = CommunityMember.objects.create(community=self, user=user, following=True)
-            member.save()
+            membership_cache(user)[self.id] = member
+            TimelineEntry.objects.backfill(user, self)
             return True
 
-        if not self.is_follower(user):
-            member = CommunityMember.objects.get(community=self, user=user)
+        if not member.following:
             member.following = True
             member.save()
+            TimelineEntry.objects.backfill(user, self)
             return True
         return False
 
     def remove_follower(self, user):
-        if not self.is_member(user):
+        member = self.get_membership(user)
+        if member is None:
             return True
 
-        if self.is_follower(user):
-            member = CommunityMember.objects.get(community=self, user=user)
+        if member.following:
             member.following = False
             member.save()
+            TimelineEntry.objects.filter(user=user, community=self).delete()
             return True
 
         return False
@@ -99,6 +141,36 @@ class Community(models.Model):
         super(Community, self).save(*args, **kwargs)
 
 
+def membership_cache(user):
+    """
+    Community id -> CommunityMember (or None) for the user, kept on the user object.
+
+    request.user lives for one request, so every Community.is_* check in a view and its templates
+    shares a single lookup per community. Code changing a membership updates or drops the entry.
+    """
+    if not hasattr(user, '_community_memberships'):
+        user._community_memberships = {}
+    return user._community_memberships
+
+
+class CommunityJoinRequestQuerySet(models.QuerySet):
+    def approve(self):
+        """
+        Approve every request in the queryset: the requesters become members in one insert and
+        the requests are marked in one update, however many there are.
+        """
+        requests = list(self.values_list('id', 'community_id', 'user_id'))
+        CommunityMember.objects.bulk_create([CommunityMember(community_id=community_id, user_id=user_id)
+                                             for _, community_id, user_id in requests],
+                                            batch_size=1000, ignore_conflicts=True)
+        return CommunityJoinRequest.objects.filter(id__in=[request_id for request_id, _, _ in requests]).update(
+            is_approved=True, is_rejected=False, updated_at=timezone.now())
+
+    def reject(self, reject_message=''):
+        return self.update(is_approved=False, is_rejected=True, reject_message=reject_message or '',
+                           updated_at=timezone.now())
+
+
 class CommunityJoinRequest(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     community = models.ForeignKey(Community, on_delete=models.CASCADE)
@@ -112,17 +184,24 @@ class CommunityJoinRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommunityJoinRequestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the review queue, one status of one community newest first
+            models.Index(fields=['community', 'is_approved', 'is_rejected', '-created_at', '-id'],
+                         name='join_request_queue_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.community}"
 
     def approve_request(self):
-        if not CommunityMember.objects.filter(community=self.community, user=self.user).exists():
-            cm = CommunityMember.objects.create(community=self.community, user=self.user)
-            cm.save()
+        CommunityJoinRequest.objects.filter(id=self.id).approve()
+        membership_cache(self.user).pop(self.community_id, None)
 
         self.is_approved = True
         self.is_rejected = False
-        self.save()
 
     def reject_request(self, reject_message):
         self.is_approved = False
@@ -139,6 +218,48 @@ class CommunityJoinRequest(models.Model):
                        kwargs={'community_slug': self.community.slug, 'request_id': self.id})
 
 
+class CommunityMemberManager(models.Manager):
+    # bulk membership changes take a fixed number of statements however many users they touch
+
+    def add_followers(self, community, user_ids):
+        """
+        Make ``user_ids`` follow ``community``, creating missing memberships in one insert and
+        switching existing members to following in one update. The new followers' home timelines
+        are backfilled. Returns the ids of the users who were not following before.
+        """
+        user_ids = set(user_ids)
+        following = set(self.filter(community=community, user_id__in=user_ids, following=True)
+                        .values_list('user_id', flat=True))
+        new_followers = user_ids - following
+        if not new_followers:
+            return new_followers
+
+        self.bulk_create([CommunityMember(community=community, user_id=user_id, following=True)
+                          for user_id in new_followers], batch_size=1000, ignore_conflicts=True)
+        self.filter(community=community, user_id__in=new_followers, following=False).update(
+            following=True, updated_at=timezone.now())
+        TimelineEntry.objects.backfill_many(new_followers, [community])
+        return new_followers
+
+    def remove_followers(self, community, user_ids):
+        """Stop ``user_ids`` following ``community`` and drop its posts from their home timelines."""
+        user_ids = list(user_ids)
+        removed = self.filter(community=community, user_id__in=user_ids, following=True).update(
+            following=False, updated_at=timezone.now())
+        TimelineEntry.objects.filter(community=community, user_id__in=user_ids).delete()
+        return removed
+
+    def follow_communities(self, user, communities):
+        """Make ``user`` follow every one of ``communities``, e.g. the auto_follow ones at signup."""
+        communities = list(communities)
+        self.bulk_create([CommunityMember(community=community, user=user, following=True)
+                          for community in communities], ignore_conflicts=True)
+        self.filter(user=user, community__in=communities, following=False).update(
+            following=True, updated_at=timezone.now())
+        TimelineEntry.objects.backfill_many([user.id], communities)
+        membership_cache(user).clear()
+
+
 class CommunityMember(models.Model):
     community = models.ForeignKey(Community, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -153,12 +274,26 @@ class CommunityMember(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommunityMemberManager()
+
     class Meta:
         unique_together = ('community', 'user')
+        indexes = [
+            # leaderboards read the top of this and count the members ranked above a user
+            models.Index(fields=['community', 'banned', '-community_rep', 'id'], name='member_leaderboard_idx'),
+        ]
+
+    _saved_banned = False  # banned as last loaded or saved, see signals.purge_leaderboard_on_ban
 
     def __str__(self):
         return f'{self.user.username} - {self.community.name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        member = super().from_db(db, field_names, values)
+        member._saved_banned = member.__dict__.get('banned', False)
+        return member
+
     def add_community_rep(self, rep):
         self.community_rep = F('community_rep') + rep
         self.save()
@@ -179,6 +314,79 @@ def post_image_location(instance, filename):
     return f'post_images/{instance.community.slug}/{instance.id}/{filename}'
 
 
+def image_blob_location(instance, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f'image_blobs/{instance.sha256[:2]}/{instance.sha256}{extension}'
+
+
+class ImageBlobManager(models.Manager):
+    def for_upload(self, upload):
+        """
+        The blob holding ``upload``'s content, storing the file only if no blob has it yet.
+
+        An existing blob is found with its row locked, so callers saving the post that refers to it
+        in the same transaction are safe from gc_image_blobs deleting it in between.
+        """
+        content_hash = getattr(upload, 'content_hash', None) or file_sha256(upload)
+        with transaction.atomic():
+            blob = self.select_for_update().filter(sha256=content_hash).first()
+        if blob:
+            return blob
+
+        blob = self.model(sha256=content_hash)
+        name = image_blob_location(blob, upload.name)
+        stored = not blob.image.storage.exists(name)
+        if stored:
+            blob.image.save(upload.name, upload, save=False)
+        else:
+            blob.image = name  # left behind by a blob that lost a race or was collected mid-upload
+        try:
+            with transaction.atomic():
+                blob.save()
+        except IntegrityError:
+            # the same image was uploaded concurrently. The storage gave this copy another name
+            # when the other one was already there, which nothing would ever refer to.
+            winner = self.get(sha256=content_hash)
+            if stored and blob.image.name != winner.image.name:
+                blob.image.storage.delete(blob.image.name)
+            return winner
+        return blob
+
+    def adjust_refs(self, added_id=None, removed_id=None):
+        if added_id:
+            self.filter(id=added_id).update(ref_count=F('ref_count') + 1)
+        if removed_id:
+            self.filter(id=removed_id).update(ref_count=F('ref_count') - 1)
+
+
+class ImageBlob(models.Model):
+    """
+    One stored image file, named by the sha256 of its content and shared by every post using it.
+
+    ``ref_count`` follows the posts pointing here, see Post.save and signals; gc_image_blobs
+    deletes blobs nothing references any more.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    image = models.ImageField(upload_to=image_blob_location)
+    variants = models.JSONField(default=dict, blank=True)  # width -> stored name, see communities.images
+    ref_count = models.IntegerField(default=0, db_index=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.sha256
+
+
+def file_sha256(upload):
+    sha256 = hashlib.sha256()
+    for chunk in upload.chunks():
+        sha256.update(chunk)
+    upload.seek(0)
+    return sha256.hexdigest()
+
+
 class Post(models.Model):
     post_types = (('image', 'Image'), ('text', 'Text'), ('link', 'Link'))
 
@@ -188,6 +396,9 @@ class Post(models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to=post_image_location, blank=True, null=True)
+    # image is the blob's file, the variants are copied from it so feeds need no join
+    image_blob = models.ForeignKey(ImageBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='posts')
+    image_variants = models.JSONField(default=dict, blank=True)
     url = models.URLField(blank=True, null=True)
 
     post_type = models.CharField(max_length=5, choices=post_types, default='image')
@@ -195,6 +406,11 @@ class Post(models.Model):
 
     like_count = models.IntegerField(default=0)
     dislike_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)  # kept in sync on write, see recount_comments for drift
+
+    # ranking columns maintained by the vote path, see communities.ranking and refresh_post_scores
+    score = models.IntegerField(default=0)
+    hot_score = models.FloatField(default=0)
 
     is_sticky = models.BooleanField(default=False)
 
@@ -203,15 +419,23 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    _saved_image_blob_id = None  # the image_blob_id last loaded or saved, for ImageBlob.ref_count
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # keyset pagination of the front page and community feeds, see communities.pagination
+            models.Index(fields=['-created_at', '-id'], name='post_feed_idx'),
+            models.Index(fields=['community', '-created_at', '-id'], name='post_community_feed_idx'),
+            models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+            models.Index(fields=['community', '-hot_score', '-id'], name='post_community_hot_idx'),
+            models.Index(fields=['-score', '-id'], name='post_top_idx'),
+            models.Index(fields=['community', '-score', '-id'], name='post_community_top_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-    def comment_count(self):
-        return PostComment.objects.filter(post=self).count()
-
     def has_user_upvote(self, user):
         pcl = PostCommentLike.objects.filter(post=self, user=user, post_comment=None, upvote=True)
         if pcl.exists():
@@ -235,7 +459,37 @@ class Post(models.Model):
                                                              'community_slug': self.community.slug}))
 
     def total_rep(self):
-        return self.like_count - self.dislike_count
+        # include votes still sitting in the write-behind buffer
+        likes, dislikes = vote_buffer.pending_counts(self)
+        return self.like_count + likes - self.dislike_count - dislikes
+
+    def image_src(self):
+        # the largest variant until they are built, then the original
+        if self.image_variants:
+            width = max(self.image_variants, key=int)
+            return self.image.storage.url(self.image_variants[width])
+        return self.image.url
+
+    def image_srcset(self):
+        return ', '.join(f'{self.image.storage.url(name)} {width}w'
+                         for width, name in sorted(self.image_variants.items(), key=lambda item: int(item[0])))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        post._saved_image_blob_id = post.__dict__.get('image_blob_id')
+        return post
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.hot_score = hot_score(self.like_count - self.dislike_count, timezone.now())
+        saved_image_blob_id = None if self._state.adding else self._saved_image_blob_id
+
+        super(Post, self).save(*args, **kwargs)
+
+        if self.image_blob_id != saved_image_blob_id:
+            ImageBlob.objects.adjust_refs(added_id=self.image_blob_id, removed_id=saved_image_blob_id)
+            self._saved_image_blob_id = self.image_blob_id
 
     def get_embed(self):
         if self.post_type == 'link':
@@ -252,6 +506,87 @@ def you_tube_embed_url(video_url):
     return re.sub(regex, r"https://www.youtube.com/embed/\1", video_url)
 
 
+class TimelineEntryManager(models.Manager):
+    # fan-out on write: home feeds read a user's own rows instead of joining every followed community
+
+    def fan_out(self, post):
+        """
+        Copy a new post into the home timeline of every follower of its community, trimming the
+        timelines it pushes over HOME_TIMELINE_LENGTH.
+        """
+        community = post.community
+        if community.fanout_on_read:
+            return
+
+        followers = CommunityMember.objects.filter(community=community, following=True).values_list('user', flat=True)
+        if followers.count() > HOME_TIMELINE_FANOUT_MAX_FOLLOWERS:
+            # from now on followers read this community's posts directly, see base.views.timeline_page
+            Community.objects.filter(id=community.id).update(fanout_on_read=True)
+            return
+
+        followers = list(followers)
+        self.bulk_create([TimelineEntry(user_id=user_id, post=post, community=community, created_at=post.created_at)
+                          for user_id in followers], batch_size=1000, ignore_conflicts=True)
+        self.trim_overflowing(followers)
+
+    def backfill(self, user, community):
+        """Add a newly followed community's latest posts to the user's home timeline."""
+        self.backfill_many([user.id], [community])
+
+    def backfill_many(self, user_ids, communities):
+        """
+        Add the latest posts of newly followed ``communities`` to the home timelines of ``user_ids``.
+
+        Only the HOME_TIMELINE_LENGTH latest posts across the communities can stay in a timeline,
+        so they are read once and copied to every user; only timelines going over the cap are trimmed.
+        """
+        communities = [community for community in communities if not community.fanout_on_read]
+        if not communities or not user_ids:
+            return
+
+        posts = Post.objects.filter(community__in=communities).order_by('-created_at', '-id').values_list(
+            'id', 'community_id', 'created_at')[:HOME_TIMELINE_LENGTH]
+        self.bulk_create([TimelineEntry(user_id=user_id, post_id=post_id, community_id=community_id,
+                                        created_at=created_at)
+                          for post_id, community_id, created_at in posts for user_id in user_ids],
+                         batch_size=1000, ignore_conflicts=True)
+        self.trim_overflowing(user_ids)
+
+    def trim_overflowing(self, user_ids):
+        """Trim the timelines of ``user_ids`` holding more than HOME_TIMELINE_LENGTH entries."""
+        overflowing = self.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+            entries=models.Count('post')).filter(entries__gt=HOME_TIMELINE_LENGTH).values_list('user_id', flat=True)
+        for user_id in overflowing:
+            self.trim(user_id)
+
+    def trim(self, user):
+        """Drop the user's (or user id's) timeline entries beyond the latest HOME_TIMELINE_LENGTH."""
+        cutoff = list(self.filter(user=user).order_by('-created_at', '-post_id').values_list(
+            'created_at', 'post_id')[HOME_TIMELINE_LENGTH:HOME_TIMELINE_LENGTH + 1])
+        if cutoff:
+            created_at, post_id = cutoff[0]
+            self.filter(models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, post_id__lte=post_id),
+                        user=user).delete()
+
+
+class TimelineEntry(models.Model):
+    """A post in a follower's materialized home timeline, written when the post is created."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    community = models.ForeignKey(Community, on_delete=models.CASCADE)
+
+    created_at = models.DateTimeField()  # the post's, so the home feed never joins to order
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_home_idx'),
+            models.Index(fields=['user', 'community'], name='timeline_unfollow_idx'),
+        ]
+
+
 class PostComment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     community = models.ForeignKey(Community, on_delete=models.CASCADE)
@@ -263,37 +598,63 @@ class PostComment(models.Model):
 
     content = models.TextField()
 
+    # materialized path: the parent's path followed by this comment's zero padded id, so ordering a
+    # thread by path yields it depth first and a subtree is a prefix match, see communities.comment_tree
+    path = models.CharField(max_length=COMMENT_PATH_MAX_LENGTH, blank=True)
+    depth = models.PositiveIntegerField(default=0)
+
     edited_at = models.DateTimeField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comment_thread_idx'),
+        ]
+
     def __str__(self):
         return self.content
 
+    def save(self, *args, **kwargs):
+        if not self.path and self.parent_comment_id and self.parent_comment.depth >= COMMENT_MAX_DEPTH:
+            # a reply past the deepest level becomes a sibling of the comment it answers
+            self.parent_comment = PostComment.objects.get(
+                id=path_ancestor_id(self.parent_comment.path, COMMENT_MAX_DEPTH - 1))
+
+        super(PostComment, self).save(*args, **kwargs)
+
+        if not self.path:
+            parent = self.parent_comment
+            self.path = (parent.path if parent else '') + str(self.id).zfill(COMMENT_PATH_STEP)
+            self.depth = parent.depth + 1 if parent else 0
+            PostComment.objects.filter(id=self.id).update(path=self.path, depth=self.depth)
+
     def has_user_upvote(self, user):
-        pcl = PostCommentLike.objects.filter(post=self.post, user=user, post_comment=self, upvote=True)
+        pcl = PostCommentLike.objects.filter(post_id=self.post_id, user=user, post_comment=self, upvote=True)
         if pcl.exists():
             return True
         return False
 
     def has_user_downvote(self, user):
-        pcl = PostCommentLike.objects.filter(post=self.post, user=user, post_comment=self, upvote=False)
+        pcl = PostCommentLike.objects.filter(post_id=self.post_id, user=user, post_comment=self, upvote=False)
         if pcl.exists():
             return True
         return False
 
     def get_absolute_url(self):
-        return f'/c/{self.community.slug}/comments/{self.post.id}/comment/{self.id}/'
+        return f'/c/{self.community.slug}/comments/{self.post_id}/comment/{self.id}/'
 
     def get_upvote_url(self):
-        return f'/c/{self.community.slug}/comments/{self.post.id}/comment/{self.id}/upvote/'
+        return f'/c/{self.community.slug}/comments/{self.post_id}/comment/{self.id}/upvote/'
 
     def get_downvote_url(self):
-        return f'/c/{self.community.slug}/comments/{self.post.id}/comment/{self.id}/downvote/'
+        return f'/c/{self.community.slug}/comments/{self.post_id}/comment/{self.id}/downvote/'
 
     def total_rep(self):
-        return self.like_count - self.dislike_count
+        # include votes still sitting in the write-behind buffer
+        likes, dislikes = vote_buffer.pending_counts(self)
+        return self.like_count + likes - self.dislike_count - dislikes
 
 
 class PostCommentLike(models.Model):
@@ -307,3 +668,55 @@ class PostCommentLike(models.Model):
 
     class Meta:
         unique_together = ('user', 'post', 'post_comment')
+        constraints = [
+            # NULL post_comment never collides in unique_together, so post votes need their own constraint
+            models.UniqueConstraint(fields=['user', 'post'], condition=models.Q(post_comment=None),
+                                    name='unique_post_vote'),
+        ]
+
+
+class SearchIndexEntry(models.Model):
+    """
+    One term of an indexed post, comment or community: the inverted index behind communities.search.
+
+    ``weight`` is how often the term occurs, boosted for titles and names. ``community`` is
+    copied from the indexed object so results are filtered by access without joining to it.
+    """
+    POST = 'post'
+    COMMENT = 'comment'
+    COMMUNITY = 'community'
+    kinds = [(POST, 'Post'), (COMMENT, 'Comment'), (COMMUNITY, 'Community')]
+
+    term = models.CharField(max_length=40)
+    kind = models.CharField(max_length=10, choices=kinds)
+    object_id = models.BigIntegerField()
+    community = models.ForeignKey(Community, on_delete=models.CASCADE, related_name='+')
+    weight = models.FloatField()
+
+    class Meta:
+        verbose_name_plural = 'search index entries'
+        unique_together = ('kind', 'object_id', 'term')
+        indexes = [
+            models.Index(fields=['term', 'kind', 'community'], name='search_term_idx'),
+        ]
+
+
+class ReputationEvent(models.Model):
+    """
+    A change of a user's reputation in a community, appended by every vote.
+
+    Votes only insert here, so authors' CommunityMember and UserMeta rows are not written once
+    per vote; communities.reputation.rollup_reputation folds new events into them periodically.
+    """
+    community = models.ForeignKey(Community, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    delta = models.IntegerField()
+
+    created_at = models.DateTimeField(default=timezone.now)
+
+
+class ReputationRollup(models.Model):
+    """Single row holding the last ReputationEvent folded into the reputation totals."""
+    last_event_id = models.BigIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
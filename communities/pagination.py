@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 20
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def paginate_by_cursor(queryset, cursor=None, keys=('created_at', 'id'), page_size=PAGE_SIZE):
+    """
+    Return one page of ``queryset`` ordered descending on ``keys`` and the cursor of the next page.
+
+    The cursor holds the sort key of the last row served, so the next page is a range scan
+    starting after it and page N costs the same as page 1. The last key must be unique.
+    Returns (objects, next_cursor); next_cursor is None on the last page. An invalid cursor
+    serves the first page.
+    """
+    queryset = filter_after_cursor(queryset, cursor, keys).order_by(*[f'-{key}' for key in keys])
+
+    objects = list(queryset[:page_size + 1])
+    if len(objects) <= page_size:
+        return objects, None
+
+    objects = objects[:page_size]
+    last = objects[-1]
+    return objects, encode_cursor([cursor_value(getattr(last, key)) for key in keys])
+
+
+def filter_after_cursor(queryset, cursor, keys):
+    """Restrict ``queryset`` to rows sorting after ``cursor`` in descending ``keys`` order."""
+    position = decode_cursor(cursor) if cursor else None
+    if not position or len(position) != len(keys):
+        return queryset
+
+    try:
+        position = [queryset.model._meta.get_field(key).to_python(value) for key, value in zip(keys, position)]
+    except ValidationError:
+        return queryset
+
+    # (k1 < v1) or (k1 = v1 and k2 < v2) or ...
+    return queryset.filter(reduce(or_, (
+        Q(**{f'{key}__lt': position[i]}, **dict(zip(keys[:i], position[:i])))
+        for i, key in enumerate(keys))))
+
+
+def cursor_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
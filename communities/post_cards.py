@@ -0,0 +1,91 @@
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+POST_CARD_CACHE_TIMEOUT = getattr(settings, 'POST_CARD_CACHE_TIMEOUT', 60 * 60)
+
+# stand-ins rendered into the shared fragment and filled per viewer. They are NUL delimited, which
+# form input cannot contain, so splitting on NUL can never cut into a post's own text.
+SLOT_DELIMITER = '\x00'
+UP_ARROW_SLOT = f'{SLOT_DELIMITER}up-arrow{SLOT_DELIMITER}'
+DOWN_ARROW_SLOT = f'{SLOT_DELIMITER}down-arrow{SLOT_DELIMITER}'
+EDIT_LINK_SLOT = f'{SLOT_DELIMITER}edit-link{SLOT_DELIMITER}'
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def post_card_stats():
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
+
+
+def card_cache_key(post, is_index):
+    # edits bump updated_at, votes the rep and comments the count, so a changed post gets a new key
+    # and the stale card ages out
+    version = f'{post.updated_at.timestamp()}:{post.total_rep()}:{post.comment_count}:{len(post.image_variants)}'
+    return f'post-card:{post.id}:{int(bool(is_index))}:{version}'
+
+
+def render_post_cards(posts, user, is_index=False):
+    """
+    Render post cards, taking the viewer independent part of each from the cache.
+
+    Only the vote arrows and the edit link depend on the viewer; they are filled into the
+    cached fragment per request. Misses are rendered and stored with one set_many.
+    """
+    keys = {post.id: card_cache_key(post, is_index) for post in posts}
+    cached = cache.get_many(keys.values())
+
+    missing = {}
+    cards = []
+    for post in posts:
+        html = cached.get(keys[post.id])
+        if html is None:
+            html = render_to_string('communities/post-card-body.html', {
+                'post': post,
+                'is_index': is_index,
+                'up_arrow_slot': UP_ARROW_SLOT,
+                'down_arrow_slot': DOWN_ARROW_SLOT,
+                'edit_link_slot': EDIT_LINK_SLOT,
+            })
+            missing[keys[post.id]] = html
+        cards.append(fill_viewer_slots(html, post, user))
+
+    if missing:
+        cache.set_many(missing, POST_CARD_CACHE_TIMEOUT)
+    with _stats_lock:
+        _stats['hits'] += len(posts) - len(missing)
+        _stats['misses'] += len(missing)
+    return mark_safe(''.join(cards))
+
+
+def fill_viewer_slots(html, post, user):
+    if hasattr(post, 'user_vote'):
+        vote = post.user_vote
+    elif user.is_authenticated:
+        vote = True if post.has_user_upvote(user) else False if post.has_user_downvote(user) else None
+    else:
+        vote = None
+
+    edit_link = ''
+    if user.is_authenticated and post.user_id == user.id:
+        edit_link = format_html('<small class="text-muted">| <a href="{}">Edit</a></small>',
+                                reverse('communities:edit-post', args=[post.community.slug, post.id]))
+
+    slots = {
+        UP_ARROW_SLOT: 'up-arrow-active' if vote is True else 'up-arrow',
+        DOWN_ARROW_SLOT: 'down-arrow-active' if vote is False else 'down-arrow',
+        EDIT_LINK_SLOT: edit_link,
+    }
+    # the odd parts are slot names, everything else is copied through untouched
+    parts = html.split(SLOT_DELIMITER)
+    for i in range(1, len(parts), 2):
+        parts[i] = slots.get(f'{SLOT_DELIMITER}{parts[i]}{SLOT_DELIMITER}', '')
+    return ''.join(parts)
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from math import log10
+
+from django.db.models import F, Value
+from django.db.models.functions import Abs, Greatest, Log, Sign
+
+# hot ranking: every 10x in net votes is worth HOT_DECAY_SECONDS of recency. The time term is fixed
+# at creation, so older posts sink as newer ones arrive without rewriting their stored score
+HOT_EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+HOT_DECAY_SECONDS = 45000
+
+# keyset sort keys for each feed ordering, see communities.pagination
+FEED_SORTS = {
+    'new': ('created_at', 'id'),
+    'hot': ('hot_score', 'id'),
+    'top': ('score', 'id'),
+}
+DEFAULT_SORT = 'new'
+
+
+def get_sort(request):
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    return sort if sort in FEED_SORTS else DEFAULT_SORT
+
+
+def hot_score(score, created_at):
+    sign = (score > 0) - (score < 0)
+    return sign * log10(max(abs(score), 1)) + (created_at - HOT_EPOCH).total_seconds() / HOT_DECAY_SECONDS
+
+
+def vote_weight(score):
+    return Sign(score) * Log(Value(10.0), Greatest(Abs(score), Value(1.0)))
+
+
+def score_changes(score_change):
+    """
+    update() kwargs moving a post's score and hot score by ``score_change`` in the same statement.
+
+    The hot score is adjusted by the difference in vote weight rather than recomputed, so the
+    time term doesn't need to be evaluated in SQL. ``score_change`` may be an expression.
+    """
+    return {
+        'score': F('score') + score_change,
+        'hot_score': F('hot_score') - vote_weight(F('score')) + vote_weight(F('score') + score_change),
+    }
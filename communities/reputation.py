@@ -0,0 +1,120 @@
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Sum, Value, When
+from django.utils import timezone
+
+from users.models import UserMeta
+from .expressions import delta_case
+from .leaderboard import purge_leaderboards
+from .models import CommunityMember, PostCommentLike, ReputationEvent, ReputationRollup
+
+# events younger than this wait for the next rollup, as a vote still open may commit a lower event id
+REPUTATION_SETTLE_SECONDS = getattr(settings, 'REPUTATION_SETTLE_SECONDS', 5)
+ROLLUP_CHUNK_SIZE = 500
+
+
+def by_user(key):
+    return {'user_id': key}
+
+
+def by_member(key):
+    return {'community_id': key[0], 'user_id': key[1]}
+
+
+def record_reputation(community_id, user_id, delta):
+    if delta:
+        ReputationEvent.objects.create(community_id=community_id, user_id=user_id, delta=delta)
+
+
+def add_reputation(member_rep):
+    """Add {(community id, user id): delta} to community_rep and the users' reputation."""
+    keys = list(member_rep)
+    for start in range(0, len(keys), ROLLUP_CHUNK_SIZE):
+        chunk = {key: member_rep[key] for key in keys[start:start + ROLLUP_CHUNK_SIZE]}
+        members = reduce(or_, (Q(community_id=c, user_id=u) for c, u in chunk))
+        existing = set(CommunityMember.objects.filter(members).values_list('community_id', 'user_id'))
+        # if user is not a member of the community, add them but follow status is false
+        CommunityMember.objects.bulk_create([CommunityMember(community_id=c, user_id=u, following=False)
+                                             for c, u in chunk if (c, u) not in existing], ignore_conflicts=True)
+        CommunityMember.objects.filter(members).update(community_rep=F('community_rep') + delta_case(chunk, by_member))
+
+        user_rep = defaultdict(int)
+        for (_, user_id), delta in chunk.items():
+            user_rep[user_id] += delta
+        UserMeta.objects.filter(user_id__in=user_rep).update(reputation=F('reputation') + delta_case(user_rep, by_user))
+
+
+def rollup_reputation(settle_seconds=REPUTATION_SETTLE_SECONDS):
+    """
+    Fold the reputation events appended since the last rollup into CommunityMember.community_rep
+    and UserMeta.reputation, with one update per chunk of authors rather than one per vote.
+    Returns the number of events folded.
+    """
+    with transaction.atomic():
+        # the locked row also keeps two rollups from folding the same events
+        state, _ = ReputationRollup.objects.select_for_update().get_or_create(id=1)
+        events = ReputationEvent.objects.filter(id__gt=state.last_event_id)
+        last_id = events.filter(created_at__lte=timezone.now() - timedelta(seconds=settle_seconds)).aggregate(
+            last_id=Max('id'))['last_id']
+        if last_id is None:
+            return 0
+
+        events = events.filter(id__lte=last_id)
+        count = events.count()
+        add_reputation({(community_id, user_id): delta for community_id, user_id, delta in events.order_by().values(
+            'community_id', 'user_id').annotate(delta=Sum('delta')).values_list('community_id', 'user_id', 'delta')})
+
+        state.last_event_id = last_id
+        state.save()
+        transaction.on_commit(purge_leaderboards)
+    return count
+
+
+def vote_rep(prefix):
+    """Per (community, author) sum of what the votes are worth, for post votes or comment votes."""
+    return PostCommentLike.objects.filter(post_comment__isnull=prefix == 'post').order_by().values(
+        f'{prefix}__community_id', f'{prefix}__user_id').annotate(
+        rep=Sum(Case(When(upvote=True, then=Value(1)), default=Value(-1), output_field=IntegerField())))
+
+
+def recompute_reputation(settle_seconds=REPUTATION_SETTLE_SECONDS):
+    """
+    Rebuild every community_rep and reputation from the PostCommentLike rows.
+
+    Votes keep coming in meanwhile, so the rollup watermark moves to the last settled event,
+    as in rollup_reputation. The events above it are subtracted from the likes by the same
+    statement that sums them, so they are left out whether or not their likes were visible,
+    and the next rollups fold each of them in once. The totals are summed per author by the
+    database and streamed back in chunks. Returns the number of (community, author) totals written.
+    """
+    with transaction.atomic():
+        state, _ = ReputationRollup.objects.select_for_update().get_or_create(id=1)
+        settled = ReputationEvent.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=settle_seconds))
+        state.last_event_id = max(settled.aggregate(last_id=Max('id'))['last_id'] or 0, state.last_event_id)
+        state.save()
+
+        CommunityMember.objects.exclude(community_rep=0).update(community_rep=0)
+        UserMeta.objects.exclude(reputation=0).update(reputation=0)
+
+        likes = [vote_rep(prefix).values_list(f'{prefix}__community_id', f'{prefix}__user_id', 'rep')
+                 for prefix in ('post', 'post_comment')]
+        pending = ReputationEvent.objects.filter(id__gt=state.last_event_id).order_by().values(
+            'community_id', 'user_id').annotate(rep=Sum(F('delta') * -1)).values_list('community_id', 'user_id', 'rep')
+
+        authors = 0
+        chunk = defaultdict(int)
+        for community_id, user_id, rep in likes[0].union(likes[1], pending, all=True).iterator():
+            chunk[(community_id, user_id)] += rep
+            if len(chunk) >= ROLLUP_CHUNK_SIZE:
+                authors += len(chunk)
+                add_reputation(chunk)
+                chunk = defaultdict(int)
+        authors += len(chunk)
+        add_reputation(chunk)
+        transaction.on_commit(purge_leaderboards)
+    return authors
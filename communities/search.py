@@ -0,0 +1,133 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, FloatField, Q, Sum, When
+
+from .models import Community, Post, PostComment, SearchIndexEntry
+from .pagination import PAGE_SIZE, decode_cursor, encode_cursor
+
+SEARCH_MAX_TERMS = getattr(settings, 'SEARCH_MAX_TERMS', 8)
+TITLE_WEIGHT = 3  # a title or name word counts as this many body words
+
+TERM_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have i in is it its of on or that the this to was were will with'
+    .split())
+
+# kind -> (model, (field, weight) pairs indexed, select_related of the results)
+INDEXED = {
+    SearchIndexEntry.POST: (Post, (('title', TITLE_WEIGHT), ('content', 1)), ('community', 'user')),
+    SearchIndexEntry.COMMENT: (PostComment, (('content', 1),), ('community', 'user', 'post')),
+    SearchIndexEntry.COMMUNITY: (Community, (('name', TITLE_WEIGHT), ('description', 1)), ()),
+}
+
+
+def tokenize(text):
+    """Lowercased words of ``text`` without stop words or a trailing 's."""
+    terms = []
+    for word in TERM_RE.findall((text or '').lower()):
+        if word.endswith("'s"):
+            word = word[:-2]
+        word = word.replace("'", '')
+        if len(word) > 1 and word not in STOP_WORDS:
+            terms.append(word[:40])
+    return terms
+
+
+def document_terms(kind, obj):
+    """{term: weight} of ``obj`` as it is indexed."""
+    weights = Counter()
+    for field, weight in INDEXED[kind][1]:
+        for term in tokenize(getattr(obj, field)):
+            weights[term] += weight
+    return weights
+
+
+def index_object(kind, obj):
+    """
+    Bring the index entries of ``obj`` in line with its text.
+
+    Only the difference is written, so saving an object whose text did not change costs the
+    one query reading its entries.
+    """
+    community_id = obj.id if kind == SearchIndexEntry.COMMUNITY else obj.community_id
+    wanted = document_terms(kind, obj)
+    entries = {entry.term: entry for entry in SearchIndexEntry.objects.filter(kind=kind, object_id=obj.id)}
+
+    removed = [entry.id for term, entry in entries.items() if term not in wanted]
+    if removed:
+        SearchIndexEntry.objects.filter(id__in=removed).delete()
+    changed = []
+    for term, entry in entries.items():
+        if term in wanted and (entry.weight != wanted[term] or entry.community_id != community_id):
+            entry.weight, entry.community_id = wanted[term], community_id
+            changed.append(entry)
+    if changed:
+        SearchIndexEntry.objects.bulk_update(changed, ['weight', 'community'])
+    SearchIndexEntry.objects.bulk_create([
+        SearchIndexEntry(term=term, kind=kind, object_id=obj.id, community_id=community_id, weight=weight)
+        for term, weight in wanted.items() if term not in entries])
+
+
+def unindex_object(kind, object_id):
+    SearchIndexEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def document_count(kind):
+    # only feeds the idf, so it may be an hour stale
+    return cache.get_or_set(f'search:documents:{kind}', lambda: INDEXED[kind][0].objects.count(), 3600)
+
+
+def search(query, user, kind=SearchIndexEntry.POST, cursor=None, page_size=PAGE_SIZE):
+    """
+    One page of the ``kind`` objects matching every term of ``query`` that ``user`` may read.
+
+    Objects are ranked by the sum over the query terms of the term's weight in the object times
+    its inverse document frequency, so rare terms and titles count most. Returns (objects,
+    next_cursor); the cursor holds the (score, id) of the last object served and the document
+    counts the idf was taken from, so every page of a search ranks with the same scores.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_TERMS]
+    if not terms:
+        return [], None
+
+    entries = SearchIndexEntry.objects.filter(kind=kind, term__in=terms)
+    position = decode_cursor(cursor) if cursor else None
+    if position and valid_position(position, len(terms)):
+        documents, frequencies = position[2], dict(zip(terms, position[3]))
+    else:
+        position = None
+        frequencies = dict(entries.order_by().values_list('term').annotate(count=Count('id')))
+        if len(frequencies) < len(terms):
+            return [], None  # some term matches nothing
+        documents = max(document_count(kind), *frequencies.values())
+    score = Sum(Case(*[When(term=term, then='weight') for term in terms], output_field=FloatField()) * Case(
+        *[When(term=term, then=math.log(1 + documents / count)) for term, count in frequencies.items()],
+        output_field=FloatField()))
+
+    ranked = entries.filter(community__in=Community.objects.accessible_to(user)).order_by().values(
+        'object_id').annotate(matched=Count('id'), score=score).filter(matched=len(terms))
+    if position:
+        ranked = ranked.filter(Q(score__lt=position[0]) | Q(score=position[0], object_id__lt=position[1]))
+    rows = list(ranked.order_by('-score', '-object_id').values_list('score', 'object_id')[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([*rows[-1], documents, [frequencies[term] for term in terms]])
+
+    model, _, related = INDEXED[kind]
+    objects = model.objects.select_related(*related).in_bulk([object_id for _, object_id in rows])
+    return [objects[object_id] for _, object_id in rows if object_id in objects], next_cursor
+
+
+def valid_position(position, term_count):
+    """Whether a decoded cursor is [score, id, documents, [count per term]] for ``term_count`` terms."""
+    if len(position) != 4 or not all(isinstance(value, (int, float)) for value in position[:2]):
+        return False
+    documents, counts = position[2:]
+    return (isinstance(documents, int) and documents > 0 and isinstance(counts, list) and len(counts) == term_count
+            and all(isinstance(count, int) and count > 0 for count in counts))
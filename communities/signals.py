@@ -0,0 +1,63 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .leaderboard import purge_leaderboards
+from .models import Community, CommunityMember, Post, PostComment, ImageBlob, SearchIndexEntry
+from .search import INDEXED, index_object, unindex_object
+
+
+@receiver(post_save, sender=PostComment)
+def increment_comment_count(sender, instance, created, raw=False, **kwargs):
+    # every way of creating a comment counts it, so the decrement below always has one to take back
+    if created and not raw:
+        Post.objects.filter(id=instance.post_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=PostComment)
+def decrement_comment_count(sender, instance, **kwargs):
+    # fires for admin deletes and for replies removed by cascade
+    Post.objects.filter(id=instance.post_id).update(comment_count=F('comment_count') - 1)
+
+
+@receiver(post_delete, sender=Post)
+def release_image_blob(sender, instance, **kwargs):
+    # the blob itself is left for gc_image_blobs
+    if instance.image_blob_id:
+        ImageBlob.objects.adjust_refs(removed_id=instance.image_blob_id)
+
+
+@receiver(post_save, sender=CommunityMember)
+def purge_leaderboard_on_ban(sender, instance, raw=False, **kwargs):
+    # reputation changes wait for the next rollup, but a banned member leaves the board at once
+    if not raw and instance.banned != instance._saved_banned:
+        instance._saved_banned = instance.banned
+        transaction.on_commit(partial(purge_leaderboards, instance.community_id))
+
+
+def update_search_index(kind):
+    indexed_fields = {field for field, _ in INDEXED[kind][1]}
+
+    def receiver(sender, instance, update_fields=None, raw=False, **kwargs):
+        # saves of counters and paths leave the text alone
+        if raw or (update_fields and not indexed_fields & set(update_fields)):
+            return
+        index_object(kind, instance)
+    return receiver
+
+
+def remove_from_search_index(kind):
+    def receiver(sender, instance, **kwargs):
+        # a deleted community takes its entries along through the foreign key
+        unindex_object(kind, instance.id)
+    return receiver
+
+
+for model, kind in ((Post, SearchIndexEntry.POST), (PostComment, SearchIndexEntry.COMMENT),
+                    (Community, SearchIndexEntry.COMMUNITY)):
+    post_save.connect(update_search_index(kind), sender=model, weak=False, dispatch_uid=f'search-index-{kind}')
+for model, kind in ((Post, SearchIndexEntry.POST), (PostComment, SearchIndexEntry.COMMENT)):
+    post_delete.connect(remove_from_search_index(kind), sender=model, weak=False, dispatch_uid=f'search-unindex-{kind}')
@@ -0,0 +1,38 @@
+let loading_posts = false;
+
+async function load_more_posts() {
+    let load_more = $('#load-more');
+    if (loading_posts || !load_more.length) {
+        return;
+    }
+    loading_posts = true;
+
+    let url = new URL(load_more.data('url'), window.location.href);
+    url.searchParams.set('cursor', load_more.data('cursor'));
+    await fetch(url, {
+        headers: {"X-Requested-With": "XMLHttpRequest"}
+    }).then(response => response.json()).then(data => {
+        $('#post-list').append(data.html);
+        if (data.next_cursor) {
+            load_more.data('cursor', data.next_cursor);
+            url.searchParams.set('cursor', data.next_cursor);
+            load_more.find('a').attr('href', url.search);
+        } else {
+            load_more.remove();
+        }
+    }).catch(error => console.log(error));
+
+    loading_posts = false;
+}
+
+$(function () {
+    let load_more = document.getElementById('load-more');
+    if (!load_more || !('IntersectionObserver' in window)) {
+        return;
+    }
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            load_more_posts();
+        }
+    }, {rootMargin: '600px'}).observe(load_more);
+});
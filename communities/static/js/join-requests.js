@@ -39,6 +39,34 @@ function reject_request(url, elem) {
 
 }
 
-function blah(){
+function select_all_requests(elem) {
+    $('.select-request').prop('checked', elem.checked);
+}
 
+function batch_requests(action) {
+    let ids = $('.select-request:checked').map(function () { return this.value; }).get();
+    if (!ids.length) {
+        return;
+    }
+    fetch($('#batch-actions').data('url'), {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken'),
+        },
+        body: JSON.stringify({
+            'action': action,
+            'ids': ids,
+            'reject_message': $('#batch-reject-message').val()
+        })
+    }).then(response => {
+        if (response.status == 200) {
+            $('.select-request:checked').each(function () {
+                $(this).prop('checked', false).closest('tr').find('button').closest('td')
+                    .html(action == 'approve' ? 'Accepted' : 'Rejected');
+            });
+        } else {
+            alert('Error updating requests');
+        }
+    });
 }
\ No newline at end of file
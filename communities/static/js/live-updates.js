@@ -0,0 +1,72 @@
+// sent with the stream and with this page's votes, so the stream leaves out the votes counted here
+window.liveStreamOrigin = Math.random().toString(36).slice(2) + Date.now().toString(36);
+
+function apply_vote_deltas(prefix, deltas) {
+    for (const [id, delta] of Object.entries(deltas)) {
+        let vote_elem = $('#' + prefix + '-rep-' + id);
+        if (vote_elem.length) {
+            vote_elem.text(parseInt(vote_elem.text()) + delta);
+        }
+    }
+}
+
+function insert_live_comment(data) {
+    let comment_list = $('#comment-list');
+    if (!comment_list.length || $('#comment-' + data.id).length) {
+        return;
+    }
+
+    let indent = 0;
+    let anchor = null;
+    if (data.parent_id) {
+        let parent = $('#comment-' + data.parent_id);
+        if (!parent.length) {
+            return;  // the parent is on another page of the thread
+        }
+        indent = parseInt(parent.data('indent')) + 1;
+        // replies go after the parent's existing subtree
+        anchor = parent;
+        while (parseInt(anchor.next().data('indent')) >= indent) {
+            anchor = anchor.next();
+        }
+    } else if (comment_list.data('complete') !== true) {
+        return;  // new top level comments belong after the last page
+    }
+
+    let wrapper = $('<div>').attr('id', 'comment-' + data.id).attr('data-indent', indent)
+        .css('margin-left', indent + 'em').html(data.html);
+    if (anchor) {
+        anchor.after(wrapper);
+    } else {
+        comment_list.append(wrapper);
+    }
+}
+
+function update_comment_count(data) {
+    let count_elem = $('#post-comments-' + data.post_id);
+    if (count_elem.length) {
+        count_elem.text(parseInt(count_elem.text()) + 1);
+    }
+}
+
+$(function () {
+    let live_stream = $('#live-stream');
+    if (!live_stream.length || !('EventSource' in window)) {
+        return;
+    }
+
+    let source = new EventSource(live_stream.data('url') + '?origin=' + window.liveStreamOrigin);
+
+    source.addEventListener('votes', event => {
+        let data = JSON.parse(event.data);
+        apply_vote_deltas('post', data.posts);
+        apply_vote_deltas('comment', data.comments);
+    });
+    source.addEventListener('comment', event => {
+        let data = JSON.parse(event.data);
+        update_comment_count(data);
+        if (data.html) {
+            insert_live_comment(data);
+        }
+    });
+});
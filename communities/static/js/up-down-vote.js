@@ -4,7 +4,8 @@ async function vote_post(url, id) {
         method: 'POST',
         headers: {
             'X-CSRFToken': getCookie("csrftoken"),
-            "X-Requested-With": "XMLHttpRequest"
+            "X-Requested-With": "XMLHttpRequest",
+            "X-Live-Origin": window.liveStreamOrigin || ""
         }
     }).then(response => response.json()).then(data => {
         let rep_change = data.rep_change;
@@ -49,6 +50,7 @@ async function vote_post(url, id) {
             up_arrow_elem.addClass('up-arrow');
         }
 
+        // the live stream leaves this vote out of its counts, see live-updates.js
         vote_elem.text(parseInt(vote_elem.text()) + rep_change);
 
     }).catch(error => console.log(error));
@@ -1,3 +1,746 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import random
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from base.views import timeline_page
+from users.models import UserMeta
+from .models import COMMENT_MAX_DEPTH, Community, CommunityJoinRequest, CommunityMember, ImageBlob, Post, \
+    PostComment, PostCommentLike, SearchIndexEntry, TimelineEntry
+from .comment_tree import load_comment_tree
+from .images import attach_image, build_variants
+from .leaderboard import member_rank, top_members
+from .live import InProcessHub, post_channel
+from .pagination import paginate_by_cursor
+from .post_cards import render_post_cards
+from .ranking import FEED_SORTS
+from .reputation import recompute_reputation, rollup_reputation
+from .search import search
+from .voting.vote_buffer import vote_buffer
+from .voting.vote_functions import toggle_upvote, toggle_downvote, VOTE_VALUES
+
+
+def create_user(username):
+    user = User.objects.create_user(username=username, password='password')
+    UserMeta.objects.create(user=user)
+    return user
+
+
+class VoteFixtureMixin:
+    def create_fixture(self, voter_count):
+        self.author = create_user('author')
+        self.community = Community.objects.create(name='Voting', description='votes')
+        self.post = Post.objects.create(community=self.community, user=self.author, title='post', post_type='text')
+        self.comment = PostComment.objects.create(post=self.post, community=self.community, user=self.author,
+                                                  content='comment')
+        self.voters = [create_user(f'voter{i}') for i in range(voter_count)]
+
+    def assertCountersMatchLikes(self):
+        for obj, likes in ((self.post, PostCommentLike.objects.filter(post=self.post, post_comment=None)),
+                           (self.comment, PostCommentLike.objects.filter(post_comment=self.comment))):
+            obj.refresh_from_db()
+            self.assertEqual(obj.like_count, likes.filter(upvote=True).count())
+            self.assertEqual(obj.dislike_count, likes.filter(upvote=False).count())
+
+        rollup_reputation(settle_seconds=0)
+        expected_rep = sum(VOTE_VALUES[upvote] for upvote in PostCommentLike.objects.values_list('upvote', flat=True))
+        member = CommunityMember.objects.get(community=self.community, user=self.author)
+        self.assertEqual(member.community_rep, expected_rep)
+        self.assertEqual(UserMeta.objects.get(user=self.author).reputation, expected_rep)
+
+
+class VoteEngineTests(VoteFixtureMixin, TestCase):
+    def setUp(self):
+        self.create_fixture(voter_count=5)
+
+    def test_transitions(self):
+        voter = self.voters[0]
+        self.assertEqual(toggle_upvote(voter, self.post), 1)
+        self.assertEqual(toggle_downvote(voter, self.post), -2)
+        self.assertEqual(toggle_downvote(voter, self.post), 1)
+        self.assertFalse(PostCommentLike.objects.filter(user=voter).exists())
+        self.assertCountersMatchLikes()
+
+    def test_post_vote_does_not_touch_comment_votes(self):
+        voter = self.voters[0]
+        toggle_upvote(voter, self.post, self.comment)
+        toggle_upvote(voter, self.post)
+        toggle_downvote(voter, self.post)
+        self.assertTrue(PostCommentLike.objects.filter(user=voter, post_comment=self.comment, upvote=True).exists())
+        self.assertCountersMatchLikes()
+
+    def test_constant_statement_count(self):
+        voter = self.voters[0]
+        toggle_upvote(voter, self.post)
+        # select, like row write, counters, reputation event, plus the savepoint pair
+        with self.assertNumQueries(6):
+            toggle_downvote(voter, self.post)
+
+    def test_random_sequence_keeps_counters_consistent(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            toggle = rng.choice((toggle_upvote, toggle_downvote))
+            toggle(rng.choice(self.voters), self.post, rng.choice((None, self.comment)))
+        self.assertCountersMatchLikes()
+
+    def test_reputation_waits_for_rollup_and_recompute_matches(self):
+        for voter in self.voters:
+            toggle_upvote(voter, self.post)
+        toggle_downvote(self.voters[0], self.post, self.comment)
+        self.assertEqual(UserMeta.objects.get(user=self.author).reputation, 0)
+        self.assertEqual(rollup_reputation(settle_seconds=3600), 0)  # still settling
+
+        self.assertEqual(rollup_reputation(settle_seconds=0), 6)
+        self.assertEqual(rollup_reputation(settle_seconds=0), 0)
+        self.assertEqual(UserMeta.objects.get(user=self.author).reputation, 4)
+
+        UserMeta.objects.filter(user=self.author).update(reputation=100)
+        recompute_reputation()
+        self.assertCountersMatchLikes()
+
+    def test_recompute_leaves_unsettled_votes_to_the_rollup(self):
+        for voter in self.voters:
+            toggle_upvote(voter, self.post)
+        rollup_reputation(settle_seconds=0)
+        toggle_downvote(self.voters[0], self.post)
+        toggle_upvote(self.voters[1], self.post, self.comment)
+
+        # the last two votes are counted in the likes but their events are still settling
+        recompute_reputation(settle_seconds=3600)
+        self.assertEqual(UserMeta.objects.get(user=self.author).reputation, 5)
+        self.assertCountersMatchLikes()
+
+
+@override_settings(VOTE_BUFFER_ENABLED=True, VOTE_BUFFER_FLUSH_MS=0)
+class BufferedVoteTests(VoteFixtureMixin, TestCase):
+    def setUp(self):
+        self.create_fixture(voter_count=5)
+
+    def test_reads_merge_pending_votes_until_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for voter in self.voters:
+                toggle_upvote(voter, self.post)
+            toggle_downvote(self.voters[0], self.post, self.comment)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(self.post.total_rep(), 5)
+        self.assertEqual(self.comment.total_rep(), -1)
+
+        with self.assertNumQueries(4):
+            vote_buffer.flush()
+        self.assertEqual(self.post.total_rep(), 0)
+        self.assertCountersMatchLikes()
+
+
+class ConcurrentVoteTests(VoteFixtureMixin, TransactionTestCase):
+    """
+    Racing votes, locked by select_for_update where the database has it. sqlite turns the
+    losers away instead, so there they serialize through cast_vote's lock conflict retries.
+    """
+
+    def setUp(self):
+        self.create_fixture(voter_count=8)
+
+    def test_concurrent_votes_keep_counters_consistent(self):
+        errors = []
+
+        def vote(voter, seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(25):
+                    toggle = rng.choice((toggle_upvote, toggle_downvote))
+                    toggle(voter, self.post, rng.choice((None, self.comment)))
+            except Exception as e:  # surfaced after join so the failure is reported in the main thread
+                errors.append(e)
+            finally:
+                connection.close()
+
+        # two threads per voter simulate double clicks racing on the same like row
+        threads = [threading.Thread(target=vote, args=(voter, seed))
+                   for seed, voter in enumerate(self.voters * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertCountersMatchLikes()
+        self.assertEqual(CommunityMember.objects.aggregate(total=Sum('community_rep'))['total'],
+                         UserMeta.objects.get(user=self.author).reputation)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    """Pages full enough that an N+1 query would blow their query_budget."""
+
+    def setUp(self):
+        self.user = create_user('reader')
+        self.community = Community.objects.create(name='Budget', description='budget')
+        authors = [create_user(f'author{i}') for i in range(3)]
+        for i in range(25):
+            post = Post.objects.create(community=self.community, user=authors[i % 3], title=f'post {i}',
+                                       post_type='text', content='content')
+            toggle_upvote(self.user, post)
+        self.post = post
+        parent = None
+        for i in range(30):
+            parent = PostComment.objects.create(post=post, community=self.community, user=authors[i % 3],
+                                                content=f'comment {i}', parent_comment=parent if i % 2 else None)
+            toggle_downvote(self.user, post, parent)
+        self.community.add_follower(self.user)  # backfills the home timeline
+        self.client.force_login(self.user)
+
+    def test_community_page(self):
+        for sort in ('new', 'hot', 'top'):
+            response = self.client.get(f'/c/{self.community.slug}/?sort={sort}')
+            self.assertEqual(response.status_code, 200)
+
+    def test_post_page(self):
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+    def test_home_page(self):
+        self.assertEqual(self.client.get('/').status_code, 200)
+
+
+@override_settings(MIDDLEWARE=['django.contrib.sessions.middleware.SessionMiddleware',
+                               'django.contrib.auth.middleware.AuthenticationMiddleware',
+                               'base.metrics.RequestMetricsMiddleware'])
+class MetricsTests(TestCase):
+    def test_metrics_are_staff_only(self):
+        # the test client connects from 127.0.0.1, like every request behind a local proxy
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+        staff = create_user('staff')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        self.assertIn('base:metrics', self.client.get('/metrics/').json()['views'])
+
+    def test_timed_backend_reports_template_time(self):
+        templates = [{'BACKEND': 'base.metrics.TimedDjangoTemplates', 'APP_DIRS': True,
+                      'OPTIONS': {'context_processors': ['django.template.context_processors.request',
+                                                         'django.contrib.auth.context_processors.auth']}}]
+        with override_settings(TEMPLATES=templates):
+            timing = self.client.get('/')['Server-Timing']
+        self.assertRegex(timing, r'tpl;dur=(?!0\.0,)')
+
+
+class LiveVoteTests(SimpleTestCase):
+    def test_votes_are_not_echoed_to_their_origin(self):
+        async def stream_votes():
+            hub = InProcessHub()
+            own, other = hub.subscribe([post_channel(1)], 'page-a'), hub.subscribe([post_channel(1)])
+            hub.publish_vote([post_channel(1)], 'post', 1, 1, 'page-a')
+            hub.publish_vote([post_channel(1)], 'post', 1, 1, 'page-b')
+            hub.publish_vote([post_channel(1)], 'comment', 2, -1, 'page-a')
+            hub.flush_votes()
+            hub.publish_vote([post_channel(1)], 'post', 1, 1, 'page-a')
+            hub.flush_votes()
+            await asyncio.sleep(0)
+            return [queue_items(own.queue), queue_items(other.queue)]
+
+        own, other = asyncio.run(stream_votes())
+        self.assertEqual(own, [{'type': 'votes', 'posts': {'1': 1}, 'comments': {}}])
+        self.assertEqual(other, [{'type': 'votes', 'posts': {'1': 2}, 'comments': {'2': -1}},
+                                 {'type': 'votes', 'posts': {'1': 1}, 'comments': {}}])
+
+
+def queue_items(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        self.author = create_user('author')
+        self.community = Community.objects.create(name='Threads', description='threads')
+        self.post = Post.objects.create(community=self.community, user=self.author, title='post', post_type='text')
+
+    def comment(self, parent=None):
+        return PostComment.objects.create(post=self.post, community=self.community, user=self.author,
+                                          content='comment', parent_comment=parent)
+
+    def test_comment_count_follows_creates_and_deletes(self):
+        parent = self.comment()
+        self.client.force_login(self.author)
+        self.client.post(f'/c/{self.community.slug}/comments/{self.post.id}/comment/{parent.id}/add-comment/',
+                         {'content': 'reply'})
+        self.comment(parent=parent)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+
+        parent.delete()  # takes both replies along
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_subtree_pages_reach_every_reply(self):
+        parent = self.comment()
+        replies = [self.comment(parent) for _ in range(26)]
+
+        thread, _ = load_comment_tree(self.post, max_children=20)
+        self.assertTrue(thread[0].more_replies)
+        self.assertEqual(len(thread), 21)
+
+        shown, after = [], None
+        while True:
+            page, after = load_comment_tree(self.post, root=parent, after=after, max_children=20, page_size=10)
+            shown += page
+            if after is None:
+                break
+        self.assertEqual([comment.id for comment in shown], [parent.id] + [reply.id for reply in replies])
+        self.assertFalse(shown[0].more_replies)
+
+        response = self.client.get(parent.get_absolute_url())
+        self.assertEqual(len(response.context['post_comments']), 27)
+
+    def test_replies_past_the_deepest_level_become_siblings(self):
+        comment = None
+        for _ in range(COMMENT_MAX_DEPTH + 1):
+            comment = self.comment(comment)
+        self.assertEqual(comment.depth, COMMENT_MAX_DEPTH)
+
+        reply = self.comment(comment)
+        self.assertEqual(reply.depth, COMMENT_MAX_DEPTH)
+        self.assertEqual(reply.parent_comment_id, comment.parent_comment_id)
+        self.assertLessEqual(len(reply.path), PostComment._meta.get_field('path').max_length)
+
+
+class PostCardTests(TestCase):
+    def test_viewer_slots_do_not_touch_post_text(self):
+        author, reader = create_user('author'), create_user('reader')
+        community = Community.objects.create(name='Cards', description='cards')
+        post = Post.objects.create(community=community, user=author, title='%%edit-link%% %%up-arrow%%',
+                                   post_type='text', content='%%down-arrow%%')
+        toggle_upvote(reader, post)
+        post.refresh_from_db()
+
+        for user in (reader, author):  # a miss, then a hit on the card cached for the reader
+            html = render_post_cards([post], user)
+            self.assertIn('%%edit-link%% %%up-arrow%%', html)
+            self.assertIn('%%down-arrow%%', html)
+            self.assertNotIn('\x00', html)
+        self.assertIn('up-arrow-active', render_post_cards([post], reader))
+        self.assertIn('>Edit</a>', render_post_cards([post], author))
+        self.assertNotIn('>Edit</a>', render_post_cards([post], reader))
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.community = Community.objects.create(name='Feeds', description='feeds')
+        self.posts = [Post.objects.create(community=self.community, user=self.author, title=f'post-{i:02}',
+                                          post_type='text') for i in range(25)]
+
+    def sorted_ids(self, sort):
+        ids, cursor = [], None
+        while True:
+            page, cursor = paginate_by_cursor(Post.objects.all(), cursor, keys=FEED_SORTS[sort], page_size=10)
+            ids += [post.id for post in page]
+            if cursor is None:
+                return ids
+
+    def test_cursor_pages_walk_the_feed_once(self):
+        self.assertEqual(self.sorted_ids('new'), [post.id for post in reversed(self.posts)])
+
+        response = self.client.get(f'/c/{self.community.slug}/feed/').json()
+        self.assertIn('post-05', response['html'])
+        self.assertNotIn('post-04', response['html'])
+        response = self.client.get(f'/c/{self.community.slug}/feed/', {'cursor': response['next_cursor']}).json()
+        self.assertIn('post-04', response['html'])
+        self.assertIsNone(response['next_cursor'])
+
+    def test_votes_reorder_hot_and_top(self):
+        liked, disliked = self.posts[3], self.posts[20]
+        for voter in [create_user(f'voter{i}') for i in range(3)]:
+            toggle_upvote(voter, liked)
+            toggle_downvote(voter, disliked)
+
+        for sort in ('hot', 'top'):
+            ids = self.sorted_ids(sort)
+            self.assertEqual((ids[0], ids[-1]), (liked.id, disliked.id), sort)
+        self.assertEqual(self.sorted_ids('hot')[1:3], [self.posts[24].id, self.posts[23].id])
+
+        stored = dict(Post.objects.values_list('id', 'hot_score'))
+        call_command('refresh_post_scores', rebuild=True, stdout=io.StringIO())
+        for post_id, score in Post.objects.values_list('id', 'hot_score'):
+            self.assertAlmostEqual(score, stored[post_id])
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.author = create_user('author')
+        self.community = Community.objects.create(name='Timeline', description='timeline')
+        self.followers = [create_user(f'follower{i}') for i in range(3)]
+        for user in self.followers:
+            self.community.add_follower(user)
+
+    def publish(self, count):
+        posts = []
+        for i in range(count):
+            post = Post.objects.create(community=self.community, user=self.author, title=f'post {i}', post_type='text')
+            TimelineEntry.objects.fan_out(post)
+            posts.append(post)
+        return posts
+
+    def test_fan_out_reaches_followers_only(self):
+        post, = self.publish(1)
+        self.assertCountEqual(TimelineEntry.objects.filter(post=post).values_list('user', flat=True),
+                              [user.id for user in self.followers])
+        self.assertEqual(timeline_page(self.followers[0])[0], [post])
+        self.assertEqual(timeline_page(self.author)[0], [])
+
+    def test_fan_out_trims_timelines_to_the_cap(self):
+        with mock.patch('communities.models.HOME_TIMELINE_LENGTH', 3):
+            posts = self.publish(5)
+        for user in self.followers:
+            self.assertEqual(list(TimelineEntry.objects.filter(user=user).order_by('-created_at', '-post_id')
+                                  .values_list('post', flat=True)), [post.id for post in posts[:-4:-1]])
+
+    def test_large_communities_switch_to_fan_out_on_read(self):
+        with mock.patch('communities.models.HOME_TIMELINE_FANOUT_MAX_FOLLOWERS', 2):
+            post, = self.publish(1)
+        self.community.refresh_from_db()
+        self.assertTrue(self.community.fanout_on_read)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(timeline_page(self.followers[0])[0], [post])
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_counters_match_rows(self):
+        call_command('generate_synthetic_data', users=20, communities=3, posts=40, comments=120, votes=200,
+                     max_depth=4, stdout=io.StringIO())
+
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(PostComment.objects.count(), 120)
+        self.assertEqual(PostComment.objects.filter(depth__gt=4).count(), 0)
+        drifted = Post.objects.annotate(
+            comments=Count('postcomment', distinct=True),
+            likes=Count('postcommentlike', filter=Q(postcommentlike__upvote=True), distinct=True),
+            dislikes=Count('postcommentlike', filter=Q(postcommentlike__upvote=False), distinct=True),
+        ).exclude(comment_count=F('comments'), like_count=F('likes'), dislike_count=F('dislikes'))
+        self.assertFalse(drifted.exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = create_user('author')
+        self.community = Community.objects.create(name='Gardening', description='tomatoes and roses')
+        self.post = Post.objects.create(community=self.community, user=self.author, title='Pruning roses',
+                                        content='Cut above an outward facing bud.', post_type='text')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.assertEqual(search('roses', self.author)[0], [self.post])
+        self.assertEqual(search('roses', self.author, SearchIndexEntry.COMMUNITY)[0], [self.community])
+
+        self.post.title = 'Pruning apple trees'
+        self.post.save()
+        self.assertEqual(search('roses', self.author)[0], [])
+        self.assertEqual(search('apple bud', self.author)[0], [self.post])
+
+        comment = PostComment.objects.create(post=self.post, community=self.community, user=self.author,
+                                             content='Works for apple trees too')
+        self.assertEqual(search('apple', self.author, SearchIndexEntry.COMMENT)[0], [comment])
+        self.post.delete()
+        self.assertFalse(SearchIndexEntry.objects.filter(kind__in=[SearchIndexEntry.POST, SearchIndexEntry.COMMENT])
+                         .exists())
+
+    def test_titles_rank_first_and_pages_do_not_overlap(self):
+        posts = [Post.objects.create(community=self.community, user=self.author, title=f'post {i}',
+                                     content='roses', post_type='text') for i in range(5)]
+        results, cursor = search('roses', self.author, page_size=3)
+        self.assertEqual(results[0], self.post)
+        more, cursor = search('roses', self.author, cursor=cursor, page_size=3)
+        self.assertIsNone(cursor)
+        self.assertCountEqual(results + more, posts + [self.post])
+
+    def test_pages_keep_their_scores_when_document_counts_change(self):
+        posts = [Post.objects.create(community=self.community, user=self.author, title=f'post {i}',
+                                     content='roses', post_type='text') for i in range(5)]
+        results, cursor = search('roses', self.author, page_size=3)
+        cache.set(f'search:documents:{SearchIndexEntry.POST}', 10 ** 6)  # the cached count refreshes between pages
+        more, cursor = search('roses', self.author, cursor=cursor, page_size=3)
+        self.assertIsNone(cursor)
+        self.assertCountEqual(results + more, posts + [self.post])
+
+    def test_results_respect_community_access(self):
+        self.community.require_join_approval = True
+        self.community.save()
+        self.assertEqual(search('roses', AnonymousUser())[0], [])
+        self.assertEqual(search('roses', create_user('outsider'))[0], [])
+        self.assertEqual(search('roses', self.author)[0], [])
+
+        self.community.add_member(self.author)
+        self.assertEqual(search('roses', self.author)[0], [self.post])
+
+
+class BulkMembershipTests(TestCase):
+    def setUp(self):
+        self.community = Community.objects.create(name='Bulk', description='bulk')
+        self.post = Post.objects.create(community=self.community, user=create_user('author'), title='post',
+                                        post_type='text')
+
+    def test_add_and_remove_followers(self):
+        users = [create_user(f'user{i}') for i in range(5)]
+        CommunityMember.objects.create(community=self.community, user=users[0])  # member, not following
+        CommunityMember.objects.create(community=self.community, user=users[1], following=True)
+
+        # read follows, insert members, update members, read posts, insert entries, check for overflow
+        with self.assertNumQueries(6):
+            added = CommunityMember.objects.add_followers(self.community, [user.id for user in users])
+        self.assertEqual(added, {user.id for user in users} - {users[1].id})
+        self.assertEqual(CommunityMember.objects.filter(community=self.community, following=True).count(), 5)
+        self.assertEqual(TimelineEntry.objects.filter(post=self.post).count(), 4)
+
+        CommunityMember.objects.remove_followers(self.community, [users[0].id, users[2].id])
+        self.assertEqual(CommunityMember.objects.filter(community=self.community, following=True).count(), 3)
+        self.assertEqual(TimelineEntry.objects.filter(post=self.post).count(), 2)
+
+    def test_approving_many_requests_takes_fixed_statements(self):
+        self.community.require_join_approval = True
+        self.community.save()
+        users = [create_user(f'user{i}') for i in range(30)]
+        CommunityMember.objects.create(community=self.community, user=users[0])
+        CommunityJoinRequest.objects.bulk_create([CommunityJoinRequest(community=self.community, user=user,
+                                                                       message='let me in') for user in users])
+
+        with self.assertNumQueries(3):
+            approved = CommunityJoinRequest.objects.filter(community=self.community).approve()
+        self.assertEqual(approved, 30)
+        self.assertEqual(CommunityMember.objects.filter(community=self.community).count(), 30)
+        self.assertTrue(self.community.has_access(users[-1]))
+
+    def test_signup_follows_auto_follow_communities(self):
+        from accounts.views import auto_follow_communities
+
+        for i in range(3):
+            community = Community.objects.create(name=f'Auto {i}', description='auto', auto_follow=True)
+            Post.objects.create(community=community, user=self.post.user, title='post', post_type='text')
+        user = create_user('newcomer')
+        with self.assertNumQueries(6):
+            auto_follow_communities(user)
+        self.assertEqual(CommunityMember.objects.filter(user=user, following=True).count(), 3)
+        self.assertEqual(TimelineEntry.objects.filter(user=user).count(), 3)
+
+
+class EditCommunityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = create_user('admin')
+        self.community = Community.objects.create(name='Open', description='open')
+        CommunityMember.objects.create(community=self.community, user=self.admin, is_admin=True)
+
+    def test_gating_a_community_drops_its_cached_pages(self):
+        url = f'/c/{self.community.slug}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(self.admin)
+        response = self.client.post(f'{url}edit/', {'name': 'Open', 'description': 'members only',
+                                                    'require_join_approval': 'on'})
+        self.assertRedirects(response, url)
+        self.client.logout()
+
+        self.assertRedirects(self.client.get(url), f'{url}join-request/', fetch_redirect_response=False)
+
+
+class MembershipCacheTests(TestCase):
+    def setUp(self):
+        self.user = create_user('member')
+        self.community = Community.objects.create(name='Gated', description='gated', require_join_approval=True)
+
+    def test_membership_is_loaded_once_and_kept_current(self):
+        CommunityMember.objects.create(community=self.community, user=self.user, is_admin=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.community.has_access(self.user))
+            self.assertTrue(self.community.is_member(self.user))
+            self.assertTrue(self.community.is_admin(self.user))
+            self.assertFalse(self.community.is_follower(self.user))
+
+        self.assertTrue(self.community.add_follower(self.user))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.community.is_follower(self.user))
+
+        # the next request gets a fresh user and sees the row as it is now
+        CommunityMember.objects.filter(community=self.community).delete()
+        self.assertTrue(self.community.is_member(self.user))
+        self.assertFalse(self.community.has_access(User.objects.get(id=self.user.id)))
+
+
+class JoinRequestReviewTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin')
+        self.community = Community.objects.create(name='Gated', description='gated', require_join_approval=True)
+        CommunityMember.objects.create(community=self.community, user=self.admin, is_admin=True)
+        self.requests = CommunityJoinRequest.objects.bulk_create([
+            CommunityJoinRequest(community=self.community, user=create_user(f'user{i}'), message='hi')
+            for i in range(25)])
+        self.client.force_login(self.admin)
+
+    def batch(self, community, **data):
+        return self.client.post(f'/c/{community.slug}/review-join-requests/batch/', json.dumps(data),
+                                content_type='application/json')
+
+    def test_queue_is_paginated(self):
+        response = self.client.get(f'/c/{self.community.slug}/review-join-requests/')
+        self.assertEqual(len(response.context['join_requests']), 20)
+        response = self.client.get(f'/c/{self.community.slug}/review-join-requests/',
+                                   {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(response.context['join_requests']), 5)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_batch_approve_and_reject(self):
+        approve, reject = self.requests[:10], self.requests[10:15]
+        response = self.batch(self.community, action='approve', ids=[request.id for request in approve])
+        self.assertEqual(response.json()['changed'], 10)
+        response = self.batch(self.community, action='reject', ids=[request.id for request in reject],
+                              reject_message='full')
+        self.assertEqual(response.json()['changed'], 5)
+
+        self.assertEqual(CommunityMember.objects.filter(community=self.community).count(), 11)
+        self.assertEqual(CommunityJoinRequest.objects.filter(is_rejected=True, reject_message='full').count(), 5)
+        self.assertEqual(CommunityJoinRequest.objects.filter(is_approved=False, is_rejected=False).count(), 10)
+
+    def test_batch_is_limited_to_admins_and_their_community(self):
+        other = Community.objects.create(name='Other', description='other', require_join_approval=True)
+        CommunityMember.objects.create(community=other, user=self.admin, is_admin=True)
+        response = self.batch(other, action='approve', ids=[self.requests[0].id])
+        self.assertEqual(response.json()['changed'], 0)
+
+        self.client.force_login(self.requests[0].user)
+        self.assertEqual(self.batch(self.community, action='approve', ids=[self.requests[0].id]).status_code, 403)
+        self.assertFalse(CommunityJoinRequest.objects.filter(is_approved=True).exists())
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.community = Community.objects.create(name='Board', description='board')
+        self.users = [create_user(f'user{i}') for i in range(5)]
+        for rep, user in zip((10, 30, 20, 30, 0), self.users):
+            CommunityMember.objects.create(community=self.community, user=user, community_rep=rep)
+
+    def test_top_members_and_ranks_agree(self):
+        board = top_members(self.community, limit=3)
+        self.assertEqual(board, [(1, 'user1', 30), (2, 'user3', 30), (3, 'user2', 20)])
+        for rank, username, rep in top_members(self.community):
+            self.assertEqual(member_rank(self.community, User.objects.get(username=username)), (rank, rep))
+        self.assertIsNone(member_rank(self.community, create_user('outsider')))
+
+    def test_boards_are_cached_until_a_rollup(self):
+        top_members(self.community)
+        author = self.users[4]
+        post = Post.objects.create(community=self.community, user=author, title='post', post_type='text')
+        for voter in self.users[:4]:
+            toggle_upvote(voter, post)
+        with self.assertNumQueries(0):
+            self.assertEqual(top_members(self.community)[-1], (5, 'user4', 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rollup_reputation(settle_seconds=0)
+        self.assertEqual(top_members(self.community)[-1], (5, 'user4', 4))
+
+    def test_banned_members_leave_the_cached_board(self):
+        self.assertEqual(top_members(self.community, limit=2), [(1, 'user1', 30), (2, 'user3', 30)])
+        member = CommunityMember.objects.get(community=self.community, user=self.users[1])
+        member.banned = True
+        with self.captureOnCommitCallbacks(execute=True):
+            member.save()
+        self.assertEqual(top_members(self.community, limit=2), [(1, 'user3', 30), (2, 'user2', 20)])
+        self.assertIsNone(member_rank(self.community, self.users[1]))
+
+    def test_endpoints(self):
+        response = self.client.get(f'/c/{self.community.slug}/leaderboard/top/', {'limit': 2})
+        self.assertEqual([member['username'] for member in response.json()['members']], ['user1', 'user3'])
+        response = self.client.get(f'/c/{self.community.slug}/leaderboard/rank/user2/')
+        self.assertEqual(response.json()['rank'], 3)
+        self.assertEqual(self.client.get(f'/c/{self.community.slug}/leaderboard/').status_code, 200)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_animated_gifs_keep_their_frames(self):
+        frames = [Image.new('RGB', (800, 400), color) for color in ('red', 'green', 'blue')]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:], duration=[50, 100, 150], loop=0)
+        blob = ImageBlob.objects.for_upload(SimpleUploadedFile('anim.gif', buffer.getvalue()))
+
+        variants = build_variants(blob)
+        self.assertEqual(sorted(variants, key=int), ['320', '640', '800'])
+        with blob.image.storage.open(variants['320']) as f:
+            variant = Image.open(f)
+            self.assertEqual((variant.format, variant.size, variant.n_frames), ('WEBP', (320, 160), 3))
+            variant.seek(2)
+            variant.load()
+            self.assertEqual(variant.info['duration'], 150)
+            self.assertGreater(variant.convert('RGB').getpixel((10, 10))[2], 200)
+
+    def test_uploads_share_blobs_until_gc_collects_the_unreferenced(self):
+        author = create_user('author')
+        community = Community.objects.create(name='Images', description='images')
+        buffer = io.BytesIO()
+        Image.new('RGB', (100, 100), 'red').save(buffer, 'PNG')
+
+        posts = []
+        for name in ('first.png', 'second.png'):
+            post = Post(community=community, user=author, title=name, post_type='image')
+            with transaction.atomic():
+                attach_image(post, SimpleUploadedFile(name, buffer.getvalue()))
+                post.save()
+            posts.append(post)
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual({post.image_blob_id for post in posts}, {blob.id})
+
+        posts[0].delete()
+        call_command('gc_image_blobs', grace_hours=0, stdout=io.StringIO())
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+
+        posts[1].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('gc_image_blobs', grace_hours=0, stdout=io.StringIO())
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(blob.image.storage.exists(blob.image.name))
+
+    def test_uploads_are_checked_and_hashed_as_they_stream(self):
+        author = create_user('author')
+        community = Community.objects.create(name='Images', description='images')
+        self.client.force_login(author)
+        buffer = io.BytesIO()
+        Image.new('RGB', (100, 100), 'red').save(buffer, 'PNG')
+
+        def upload(name, content):
+            return self.client.post(f'/c/{community.slug}/new-post/', {
+                'post_type': 'image', 'title': name, 'image': SimpleUploadedFile(name, content)})
+
+        response = upload('notes.png', b'plain text, not an image')
+        self.assertEqual(response.context['form'].errors['image'], ['Upload a JPEG, PNG, GIF or WebP image.'])
+        with mock.patch('communities.uploads.IMAGE_UPLOAD_MAX_BYTES', 100):
+            response = upload('large.png', buffer.getvalue())
+        self.assertIn('Images may be at most', response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+        self.assertEqual(upload('red.png', buffer.getvalue()).status_code, 302)
+        blob = Post.objects.get().image_blob
+        self.assertEqual(blob.sha256, hashlib.sha256(buffer.getvalue()).hexdigest())
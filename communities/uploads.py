@@ -0,0 +1,81 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler, StopUpload
+from django.template.defaultfilters import filesizeformat
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+IMAGE_UPLOAD_MAX_BYTES = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+
+# leading bytes of the formats Pillow is expected to handle for posts
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 0),  # jpeg
+    (b'\x89PNG\r\n\x1a\n', 0),
+    (b'GIF87a', 0),
+    (b'GIF89a', 0),
+    (b'WEBP', 8),  # after the RIFF header
+)
+
+
+def is_image_header(chunk):
+    return any(chunk[offset:offset + len(signature)] == signature for signature, offset in IMAGE_SIGNATURES)
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spool post images to a temporary file, rejecting bad uploads as their first bytes arrive.
+
+    A body declaring more than IMAGE_UPLOAD_MAX_BYTES, a file growing past it or a first chunk
+    without an image signature stops the upload without reading the rest of the request. The
+    reason is left on ``request.image_upload_errors`` for the view to show on the form. The
+    file's sha256 is computed while it streams and exposed as ``content_hash``.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # allow a chunk for the other form fields, each file's own size is checked as it streams
+        self.body_too_large = bool(content_length and content_length > IMAGE_UPLOAD_MAX_BYTES + self.chunk_size)
+
+    def new_file(self, *args, **kwargs):
+        if self.body_too_large:
+            self.reject(f'Images may be at most {filesizeformat(IMAGE_UPLOAD_MAX_BYTES)}.')
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not is_image_header(raw_data):
+            self.reject('Upload a JPEG, PNG, GIF or WebP image.')
+        if start + len(raw_data) > IMAGE_UPLOAD_MAX_BYTES:
+            self.reject(f'Images may be at most {filesizeformat(IMAGE_UPLOAD_MAX_BYTES)}.')
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.content_hash = self.sha256.hexdigest()
+        return upload
+
+    def reject(self, message):
+        self.request.image_upload_errors = [message]
+        raise StopUpload(connection_reset=True)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ImageUploadMixin:
+    """
+    Parse the view's uploads with ImageUploadHandler.
+
+    Upload handlers can only be swapped before anything reads request.POST, which the CSRF
+    middleware does, so the check is moved inside dispatch. The mixin must come first in the
+    bases for its csrf_exempt dispatch to be the one the view uses.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
+    def add_upload_errors(self, form):
+        errors = getattr(self.request, 'image_upload_errors', None)
+        if errors and 'image' in form.fields:
+            # replaces the "Image is required." of the rejected, and so missing, file
+            form.errors['image'] = form.error_class(errors)
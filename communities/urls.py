@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .live import live_stream
 
 app_name = 'communities'
 
@@ -8,11 +9,17 @@ urlpatterns = [
     path('create/', views.CreateCommunityView.as_view(), name='create'),
     path('change-form-type/<str:form_type>/', views.change_form_type, name='change-form-type'),
     path('<slug:community_slug>/', views.view_community, name='detail'),
+    path('<slug:community_slug>/feed/', views.community_feed, name='feed'),
+    path('<slug:community_slug>/live/', live_stream, name='live'),
+    path('<slug:community_slug>/leaderboard/', views.leaderboard, name='leaderboard'),
+    path('<slug:community_slug>/leaderboard/top/', views.leaderboard_top, name='leaderboard-top'),
+    path('<slug:community_slug>/leaderboard/rank/<str:username>/', views.leaderboard_rank, name='leaderboard-rank'),
     path('<slug:community_slug>/join-request/', views.RequestJoinView.as_view(), name='request-join'),
     path('<slug:community_slug>/join-request/done', views.join_complete, name='request-join-done'),
     path('<slug:community_slug>/review-join-requests/', views.ReviewJoinRequests.as_view(), name='review-join-requests'),
     path('<slug:community_slug>/review-join-requests/<int:request_id>/approved/', views.approve_join_request, name='approve-join-request'),
     path('<slug:community_slug>/review-join-requests/<int:request_id>/reject/', views.reject_join_request, name='reject-join-request'),
+    path('<slug:community_slug>/review-join-requests/batch/', views.review_join_requests_batch, name='review-join-requests-batch'),
     path('<slug:community_slug>/review-join-requests/<str:status>/', views.ReviewJoinRequests.as_view(), name='review-join-requests-by-status'),
     path('<slug:community_slug>/edit/', views.EditCommunityView.as_view(), name='edit'),
     path('<slug:community_slug>/join/', views.JoinCommunityView.as_view(), name='join'),
@@ -20,10 +27,12 @@ urlpatterns = [
     path('<slug:community_slug>/verify-unjoin/', views.verify_unfollow, name='unjoin-verify'),
     path('<slug:community_slug>/new-post/', views.CreatePostView.as_view(), name='create-post'),
     path('<slug:community_slug>/comments/<int:post_id>/', views.post_view, name='view-post'),
+    path('<slug:community_slug>/comments/<int:post_id>/live/', live_stream, name='live-post'),
     path('<slug:community_slug>/comments/<int:post_id>/edit/', views.EditPostView.as_view(), name='edit-post'),
     path('<slug:community_slug>/comments/<int:post_id>/add-comment/', views.AddCommentView.as_view(), name='post-add-comment'),
     path('<slug:community_slug>/comments/<int:post_id>/upvote/', views.upvote_post_comment, name='upvote-post'),
     path('<slug:community_slug>/comments/<int:post_id>/downvote/', views.downvote_post_comment, name='downvote-post'),
+    path('<slug:community_slug>/comments/<int:post_id>/comment/<int:comment_id>/', views.post_view, name='view-comment'),
     path('<slug:community_slug>/comments/<int:post_id>/comment/<int:comment_id>/edit/', views.EditCommentView.as_view(), name='edit-comment'),
     path('<slug:community_slug>/comments/<int:post_id>/comment/<int:comment_id>/add-comment/', views.AddCommentView.as_view(), name='comment-add-comment'),
     path('<slug:community_slug>/comments/<int:post_id>/comment/<int:comment_id>/upvote/', views.upvote_post_comment, name='upvote-comment'),
@@ -2,12 +2,26 @@ from django.shortcuts import render, reverse, get_object_or_404, HttpResponse, r
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q
+from django.conf import settings
+from django.contrib.auth.models import User
 
 from .forms import CommunityForm, CommentForm, LinkPostForm, TextPostForm, ImagePostForm, JoinRequestForm
-from .models import Community, Post, PostComment, CommunityMember, CommunityJoinRequest
-from .voting.vote_functions import toggle_upvote, toggle_downvote, create_voting
+from .models import Community, Post, PostComment, CommunityMember, CommunityJoinRequest, TimelineEntry
+from .comment_tree import load_comment_tree
+from .images import attach_image, schedule_variants
+from .leaderboard import LEADERBOARD_SIZE, member_rank, top_members
+from .uploads import ImageUploadMixin
+from .live import publish_comment
+from .pagination import paginate_by_cursor
+from .ranking import FEED_SORTS, get_sort
+from base.metrics import query_budget
+from base.page_cache import anonymous_page_cache, purge_community_pages, purge_for_post_activity
+from users.notifications import notify_comment
+from .voting.vote_functions import toggle_upvote, toggle_downvote, create_voting, attach_user_votes
 
 from datetime import datetime
 import logging
@@ -15,6 +29,8 @@ import json
 
 logger = logging.getLogger('app_api')
 
+JOIN_REQUEST_BATCH_SIZE = getattr(settings, 'JOIN_REQUEST_BATCH_SIZE', 500)
+
 
 # Create your views here.
 def index(request):
@@ -27,13 +43,20 @@ def index(request):
     return render(request, 'communities/index.html', {'communities': communities})
 
 
+@anonymous_page_cache(lambda community_slug: community_slug)
+@query_budget(10)
 def view_community(request, community_slug):
     community = Community.objects.get(slug=community_slug)
     if not community.has_access(request.user):
         return redirect(reverse('communities:request-join', kwargs={'community_slug': community_slug}))
 
-    posts = Post.objects.filter(community=community)
+    sort = get_sort(request)
+    posts, next_cursor = community_posts_page(request, community, sort)
+    feed_url = reverse('communities:feed', kwargs={'community_slug': community_slug})
     return render(request, 'communities/community.html', {'posts': posts,
+                                                          'next_cursor': next_cursor,
+                                                          'sort': sort,
+                                                          'feed_url': f'{feed_url}?sort={sort}',
                                                           'community': community,
                                                           'is_community_member': community.is_member(request.user),
                                                           'is_follower': community.is_follower(request.user),
@@ -41,6 +64,63 @@ def view_community(request, community_slug):
                                                           'is_index': False})
 
 
+@anonymous_page_cache(lambda community_slug: community_slug)
+def community_feed(request, community_slug):
+    community = get_object_or_404(Community, slug=community_slug)
+    if not community.has_access(request.user):
+        return HttpResponse(status=403)
+
+    posts, next_cursor = community_posts_page(request, community, get_sort(request))
+    html = render_to_string('communities/post-list.html', {'posts': posts, 'is_index': False}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor}, status=200)
+
+
+def leaderboard(request, community_slug):
+    community = get_object_or_404(Community, slug=community_slug)
+    if not community.has_access(request.user):
+        return redirect(reverse('communities:request-join', kwargs={'community_slug': community_slug}))
+
+    viewer_rank = member_rank(community, request.user) if request.user.is_authenticated else None
+    return render(request, 'communities/leaderboard.html', {'community': community,
+                                                            'members': top_members(community),
+                                                            'viewer_rank': viewer_rank})
+
+
+def leaderboard_top(request, community_slug):
+    community = get_object_or_404(Community, slug=community_slug)
+    if not community.has_access(request.user):
+        return HttpResponse(status=403)
+
+    try:
+        limit = int(request.GET.get('limit', LEADERBOARD_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest('limit must be a number')
+    members = [{'rank': rank, 'username': username, 'community_rep': rep}
+               for rank, username, rep in top_members(community, limit)]
+    return JsonResponse({'community': community.slug, 'members': members}, status=200)
+
+
+def leaderboard_rank(request, community_slug, username):
+    community = get_object_or_404(Community, slug=community_slug)
+    if not community.has_access(request.user):
+        return HttpResponse(status=403)
+
+    user = get_object_or_404(User, username=username)
+    ranked = member_rank(community, user)
+    if ranked is None:
+        return JsonResponse({'community': community.slug, 'username': username, 'rank': None}, status=404)
+    rank, rep = ranked
+    return JsonResponse({'community': community.slug, 'username': username, 'rank': rank, 'community_rep': rep},
+                        status=200)
+
+
+def community_posts_page(request, community, sort):
+    posts = Post.objects.filter(community=community).select_related('community', 'user')
+    posts, next_cursor = paginate_by_cursor(posts, request.GET.get('cursor'), keys=FEED_SORTS[sort])
+    attach_user_votes(request.user, posts=posts)
+    return posts, next_cursor
+
+
 class RequestJoinView(LoginRequiredMixin, View):
     form = JoinRequestForm
     template_name = 'communities/join-community.html'
@@ -90,20 +170,53 @@ class ReviewJoinRequests(LoginRequiredMixin, View):
         if community.is_admin(request.user):
             status = kwargs.get('status', None)
             if status == 'accepted':
-                join_requests = CommunityJoinRequest.objects.filter(community__slug=community_slug, is_approved=True,
+                join_requests = CommunityJoinRequest.objects.filter(community=community, is_approved=True,
                                                                     is_rejected=False)
             elif status == 'rejected':
-                join_requests = CommunityJoinRequest.objects.filter(community__slug=community_slug, is_approved=False,
+                join_requests = CommunityJoinRequest.objects.filter(community=community, is_approved=False,
                                                                     is_rejected=True)
             else:
-                join_requests = CommunityJoinRequest.objects.filter(community__slug=community_slug, is_approved=False,
+                join_requests = CommunityJoinRequest.objects.filter(community=community, is_approved=False,
                                                                     is_rejected=False)
 
+            join_requests, next_cursor = paginate_by_cursor(join_requests.select_related('user', 'community'),
+                                                            request.GET.get('cursor'))
             return render(request, self.template_name, {'join_requests': join_requests,
                                                         'community': community,
-                                                        'status': status})
+                                                        'status': status,
+                                                        'next_cursor': next_cursor})
+        return HttpResponse(status=403)
+
+
+@login_required
+def review_join_requests_batch(request, community_slug):
+    """
+    Approve or reject the selected join requests of a community in one transaction.
+
+    Takes JSON {"action": "approve" or "reject", "ids": [...], "reject_message": "..."} and
+    answers with the number of requests changed. At most JOIN_REQUEST_BATCH_SIZE ids per call.
+    """
+    community = get_object_or_404(Community, slug=community_slug)
+    if request.method != 'POST' or not community.is_admin(request.user):
         return HttpResponse(status=403)
 
+    try:
+        data = json.loads(request.body)
+        action = data['action']
+        ids = [int(request_id) for request_id in data['ids']]
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Expected {"action": ..., "ids": [...]}.')
+    if action not in ('approve', 'reject') or len(ids) > JOIN_REQUEST_BATCH_SIZE:
+        return HttpResponseBadRequest(f'Approve or reject at most {JOIN_REQUEST_BATCH_SIZE} requests at once.')
+
+    join_requests = CommunityJoinRequest.objects.filter(community=community, id__in=ids)
+    with transaction.atomic():
+        if action == 'approve':
+            changed = join_requests.approve()
+        else:
+            changed = join_requests.reject(data.get('reject_message', ''))
+    return JsonResponse({'action': action, 'changed': changed}, status=200)
+
 
 def approve_join_request(request, community_slug, request_id):
     if request.user.is_anonymous:
@@ -111,7 +224,7 @@ def approve_join_request(request, community_slug, request_id):
     community = get_object_or_404(Community, slug=community_slug)
 
     if community.is_admin(request.user):
-        join_request = get_object_or_404(CommunityJoinRequest, id=request_id)
+        join_request = get_object_or_404(CommunityJoinRequest, id=request_id, community=community)
         try:
             join_request.approve_request()
             return HttpResponse(status=200)
@@ -126,7 +239,7 @@ def reject_join_request(request, community_slug, request_id):
 
     community = get_object_or_404(Community, slug=community_slug)
     if community.is_admin(request.user):
-        join_request = get_object_or_404(CommunityJoinRequest, id=request_id)
+        join_request = get_object_or_404(CommunityJoinRequest, id=request_id, community=community)
         logger.info('joy in rejection')
         try:
             logger.info(request.body)
@@ -197,8 +310,8 @@ class EditCommunityView(LoginRequiredMixin, View):
         return HttpResponse(status=403)
 
     def post(self, request, community_slug):
-        form = self.form(request.POST)
         community = get_object_or_404(Community, slug=community_slug)
+        form = self.form(request.POST, instance=community)
         if community.is_admin(request.user):
             if form.is_valid():
                 community.name = form.cleaned_data['name']
@@ -207,6 +320,8 @@ class EditCommunityView(LoginRequiredMixin, View):
                 community.require_join_approval = form.cleaned_data['require_join_approval']
 
                 community.save()
+                # cached anonymous pages may no longer be visible to them, or show the old name
+                purge_community_pages(community)
 
                 return redirect(reverse('communities:detail', kwargs={'community_slug': community.slug}))
             return render(request, self.template_name, {'form': form, 'community': community, 'edit': True})
@@ -267,7 +382,7 @@ def get_form_type(post_type, data=None, files=None, initial=None):
         return None
 
 
-class EditPostView(LoginRequiredMixin, View):
+class EditPostView(ImageUploadMixin, LoginRequiredMixin, View):
     login_url = f'/accounts/login/?next=/c/'
     template_name = 'communities/create-post.html'
 
@@ -290,11 +405,16 @@ class EditPostView(LoginRequiredMixin, View):
         post_type = request.POST.get('post_type')
         if post.user == request.user:
             form = get_form_type(post_type, data=request.POST, files=request.FILES, initial=post)
+            self.add_upload_errors(form)
             if form.is_valid():
                 community = get_object_or_404(Community, slug=community_slug)
-                post = get_post_object_from_form(user=request.user, community=community, form=form,
-                                                 post_type=post_type, post=post)
-                post.save()
+                with transaction.atomic():  # keeps the image blob locked until the post refers to it
+                    post = get_post_object_from_form(user=request.user, community=community, form=form,
+                                                     post_type=post_type, post=post)
+                    post.save()
+                purge_community_pages(community)
+                if post_type == 'image' and 'image' in form.changed_data and not post.image_variants:
+                    schedule_variants(post.image_blob)
                 return redirect(reverse('communities:detail', kwargs={'community_slug': community_slug}))
             else:
                 return HttpResponseBadRequest()
@@ -317,7 +437,7 @@ def get_post_object_from_form(user, community, form, post_type, post=None):
             post.edited_at = edited_at
             return post
         else:
-            return Post.objects.create(
+            post = Post.objects.create(
                 title=form.cleaned_data['title'],
                 url=form.cleaned_data['url'],
                 user=user,
@@ -325,6 +445,8 @@ def get_post_object_from_form(user, community, form, post_type, post=None):
                 post_type=post_type,
                 nsfw_flag=form.cleaned_data['nsfw_flag'],
             )
+            TimelineEntry.objects.fan_out(post)
+            return post
     elif post_type == 'text':
         if edited_at:
             post.title = form.cleaned_data['title']
@@ -334,7 +456,7 @@ def get_post_object_from_form(user, community, form, post_type, post=None):
             post.edited_at = edited_at
             return post
         else:
-            return Post.objects.create(
+            post = Post.objects.create(
                 community=community,
                 user=user,
                 title=form.cleaned_data['title'],
@@ -342,29 +464,34 @@ def get_post_object_from_form(user, community, form, post_type, post=None):
                 post_type=post_type,
                 nsfw_flag=form.cleaned_data['nsfw_flag'],
             )
+            TimelineEntry.objects.fan_out(post)
+            return post
     elif post_type == 'image':
         if edited_at:
             image = form.cleaned_data.get('image', None)
             logger.info(image)
             post.title = form.cleaned_data['title']
-            if image:
-                post.image = image
+            if image and 'image' in form.changed_data:
+                attach_image(post, image)
             post.post_type = post_type
             post.nsfw_flag = form.cleaned_data['nsfw_flag']
             post.edited_at = edited_at
             return post
         else:
-            return Post.objects.create(
+            post = Post(
                 title=form.cleaned_data['title'],
                 user=user,
                 community=community,
-                image=form.cleaned_data.get('image'),
                 post_type=post_type,
                 nsfw_flag=form.cleaned_data['nsfw_flag'],
             )
+            attach_image(post, form.cleaned_data.get('image'))
+            post.save()
+            TimelineEntry.objects.fan_out(post)
+            return post
 
 
-class CreatePostView(LoginRequiredMixin, View):
+class CreatePostView(ImageUploadMixin, LoginRequiredMixin, View):
     login_url = f'/accounts/login/?next=/c/new-post/'  # should learn how to use reverse here
     link_form = LinkPostForm
     text_form = TextPostForm
@@ -383,12 +510,17 @@ class CreatePostView(LoginRequiredMixin, View):
     def post(self, request, community_slug):
         post_type = request.POST.get('post_type')
         form = get_form_type(post_type, data=request.POST, files=request.FILES)
+        self.add_upload_errors(form)
         if form.is_valid():
             community = get_object_or_404(Community, slug=community_slug)
-            post = get_post_object_from_form(user=request.user, community=community, form=form,
-                                             post_type=post_type)
-            post.save()
+            with transaction.atomic():  # keeps the image blob locked until the post refers to it
+                post = get_post_object_from_form(user=request.user, community=community, form=form,
+                                                 post_type=post_type)
+                post.save()
             create_voting(request.user, post)
+            purge_community_pages(community)
+            if post_type == 'image' and not post.image_variants:
+                schedule_variants(post.image_blob)
 
             return redirect('communities:detail', community_slug=community.slug)
 
@@ -502,15 +634,18 @@ class AddCommentView(LoginRequiredMixin, View):
 
                 post = get_object_or_404(Post, id=post_id)
 
-                comment = PostComment.objects.create(
-                    post=post,
-                    community=post.community,
-                    user=request.user,
-                    parent_comment=parent_comment,
-                    content=form.cleaned_data['content'],
-                )
-                comment.save()
-                create_voting(request.user, post, comment)
+                with transaction.atomic():
+                    comment = PostComment.objects.create(
+                        post=post,
+                        community=post.community,
+                        user=request.user,
+                        parent_comment=parent_comment,
+                        content=form.cleaned_data['content'],
+                    )
+                    create_voting(request.user, post, comment)
+                    notify_comment(comment)
+                    transaction.on_commit(lambda: publish_comment(comment))
+                    transaction.on_commit(lambda: purge_for_post_activity(post))
 
                 return redirect('communities:view-post', community_slug=post.community.slug, post_id=post_id)
 
@@ -522,12 +657,21 @@ class AddCommentView(LoginRequiredMixin, View):
         return HttpResponse(status=403)
 
 
+@query_budget(10)
 def post_view(request, *args, **kwargs):
     communitiy = get_object_or_404(Community, slug=kwargs.get('community_slug'))
     if communitiy.has_access(request.user):
-        post = get_object_or_404(Post, id=kwargs['post_id'])
-        post_comments = PostComment.objects.filter(post=post)
-        return render(request, 'communities/view-post.html', {'post': post, 'post_comments': post_comments})
+        post = get_object_or_404(Post.objects.select_related('community', 'user'), id=kwargs['post_id'])
+        root = None
+        if 'comment_id' in kwargs.keys():
+            root = get_object_or_404(PostComment, id=kwargs['comment_id'], post=post)
+
+        post_comments, next_after = load_comment_tree(post, root=root, after=request.GET.get('after'))
+        attach_user_votes(request.user, posts=[post], post_comments=post_comments)
+        return render(request, 'communities/view-post.html', {'post': post,
+                                                              'root_comment': root,
+                                                              'post_comments': post_comments,
+                                                              'next_after': next_after})
     return HttpResponse(status=403)
 
 
@@ -545,7 +689,8 @@ def upvote_post_comment(request, *args, **kwargs):
             object_type = 'post'
             user = post.user
 
-        rep_change = toggle_upvote(voting_user=request.user, post=post, post_comment=post_comment)
+        rep_change = toggle_upvote(voting_user=request.user, post=post, post_comment=post_comment,
+                                   origin=request.headers.get('X-Live-Origin'))
         data = {'rep_change': rep_change, 'vote_type': 'up', 'object_type': object_type}
         return JsonResponse(data, status=200)
     return HttpResponse(status=403)
@@ -563,7 +708,8 @@ def downvote_post_comment(request, *args, **kwargs):
             post_comment = None
             object_type = 'post'
 
-        rep_change = toggle_downvote(voting_user=request.user, post=post, post_comment=post_comment)
+        rep_change = toggle_downvote(voting_user=request.user, post=post, post_comment=post_comment,
+                                     origin=request.headers.get('X-Live-Origin'))
         data = {'rep_change': rep_change, 'vote_type': 'down', 'object_type': object_type}
         return JsonResponse(data, status=200)
     return HttpResponse(status=403)
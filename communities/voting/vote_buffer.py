@@ -0,0 +1,129 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from communities.expressions import delta_case
+from communities.ranking import score_changes
+
+logger = logging.getLogger('app_api')
+
+
+def buffering_enabled():
+    return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+
+def flush_interval_ms():
+    # 0 disables the background flusher, vote_buffer.flush() must then be called by a job
+    return getattr(settings, 'VOTE_BUFFER_FLUSH_MS', 500)
+
+
+def by_id(key):
+    return {'id': key}
+
+
+class VoteBuffer:
+    """
+    In-process accumulator for post and comment vote counter deltas.
+
+    Votes under the buffered mode only touch their own PostCommentLike row; the counter
+    deltas are summed here and a background thread applies them every VOTE_BUFFER_FLUSH_MS
+    with one UPDATE per table, so a viral post's row is written once per flush rather
+    than once per vote. Reputation goes through the ledger instead, see communities.reputation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._reset()
+
+    def _reset(self):
+        self.post_counts = defaultdict(lambda: [0, 0])  # post id -> [likes, dislikes]
+        self.comment_counts = defaultdict(lambda: [0, 0])  # comment id -> [likes, dislikes]
+
+    def add_vote_counts(self, like_change, dislike_change, post, post_comment=None):
+        with self._lock:
+            if post_comment:
+                counts = self.comment_counts[post_comment.id]
+            else:
+                counts = self.post_counts[post.id]
+            counts[0] += like_change
+            counts[1] += dislike_change
+        self._ensure_flusher()
+
+    def pending_counts(self, obj):
+        """Unflushed [likes, dislikes] for a Post or PostComment."""
+        counts = self.comment_counts if obj._meta.model_name == 'postcomment' else self.post_counts
+        with self._lock:
+            pending = counts.get(obj.id)
+            return list(pending) if pending else [0, 0]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                post_counts, comment_counts = self.post_counts, self.comment_counts
+                self._reset()
+
+            if not (post_counts or comment_counts):
+                return
+
+            try:
+                with transaction.atomic():
+                    self._apply(post_counts, comment_counts)
+            except Exception:
+                logger.exception('vote buffer flush failed, deltas kept for the next flush')
+                with self._lock:
+                    self._merge(post_counts, comment_counts)
+                raise
+
+    def _merge(self, post_counts, comment_counts):
+        for target, source in ((self.post_counts, post_counts), (self.comment_counts, comment_counts)):
+            for key, (likes, dislikes) in source.items():
+                target[key][0] += likes
+                target[key][1] += dislikes
+
+    @staticmethod
+    def _apply(post_counts, comment_counts):
+        from communities.models import Post, PostComment
+
+        for model, counts in ((Post, post_counts), (PostComment, comment_counts)):
+            if counts:
+                changes = {
+                    'like_count': F('like_count') + delta_case({k: v[0] for k, v in counts.items()}, by_id),
+                    'dislike_count': F('dislike_count') + delta_case({k: v[1] for k, v in counts.items()}, by_id),
+                }
+                if model is Post:
+                    changes.update(score_changes(delta_case({k: v[0] - v[1] for k, v in counts.items()}, by_id)))
+                model.objects.filter(id__in=counts.keys()).update(**changes)
+
+    def _ensure_flusher(self):
+        interval = flush_interval_ms()
+        if not interval or (self._flusher and self._flusher.is_alive()):
+            return
+        with self._lock:
+            if self._flusher and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, args=(interval / 1000,),
+                                             name='vote-buffer-flusher', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush_quietly()
+
+    def flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # already logged, the deltas are retried on the next flush
+
+
+vote_buffer = VoteBuffer()
+atexit.register(vote_buffer.flush_quietly)
@@ -1,132 +1,145 @@
-from communities.models import PostCommentLike, CommunityMember
-from users.models import UserMeta
+from communities.models import PostCommentLike, Post, PostComment
+from base.page_cache import purge_for_post_activity
+from communities.live import publish_vote
+from communities.ranking import score_changes
+from communities.reputation import record_reputation
+from communities.voting.vote_buffer import vote_buffer, buffering_enabled
 import logging
-from django.db.models import F
+import random
+import time
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.db.models import F, Q
 
 logger = logging.getLogger('app_api')
 
-
-def toggle_upvote(voting_user, post, post_comment=None):
-    obj = post_comment or post
-
-    rep_change = 0
-    if remove_downvote_if_exists(user=voting_user, post=post, post_comment=post_comment):
-        rep_change += 1
-        obj.dislike_count = F('dislike_count') - 1
-
-    if remove_upvote_if_exists(user=voting_user, post=post, post_comment=post_comment):
-        rep_change -= 1
-        obj.like_count = F('like_count') - 1
-    else:  # add upvote because it doesn't exist
-        rep_change += 1
-        obj.like_count = F('like_count') + 1
-        add_upvote(user=voting_user, post=post, post_comment=post_comment)
-
-    add_user_rep(rep_change, post, post_comment)
-    obj.save()
-
-    return rep_change
-
-
-def toggle_downvote(voting_user, post, post_comment=None):
-    obj = post_comment or post
-    rep_change = 0
-    if remove_upvote_if_exists(user=voting_user, post=post, post_comment=post_comment):
-        rep_change -= 1
-        obj.like_count = F('like_count') - 1
-
-    if remove_downvote_if_exists(user=voting_user, post=post, post_comment=post_comment):
-        rep_change += 1
-        obj.dislike_count = F('dislike_count') - 1
-    else:
-        rep_change -= 1
-        obj.dislike_count = F('dislike_count') + 1
-        add_downvote(user=voting_user, post=post, post_comment=post_comment)
-
-    add_user_rep(rep_change, post, post_comment)
-    obj.save()
-
-    return rep_change
-
-
-def add_upvote(user, post, post_comment=None):
-    post_comment_like = PostCommentLike.objects.create(
-        user=user,
-        upvote=True,
-        post=post,
-        post_comment=post_comment
-    )
-    post_comment_like.save()
-
-
-def add_downvote(user, post, post_comment=None):
-    post_comment_like = PostCommentLike.objects.create(
-        user=user,
-        upvote=False,
-        post=post,
-        post_comment=post_comment
-    )
-    post_comment_like.save()
-
-
-def remove_upvote_if_exists(user, post, post_comment=None):
-    if post_comment:
-        pcl = PostCommentLike.objects.filter(user=user, post=post, post_comment=post_comment, upvote=True)
+# reputation a vote is worth, keyed by PostCommentLike.upvote (None means no vote)
+VOTE_VALUES = {True: 1, False: -1, None: 0}
+# how long a vote keeps retrying when the database turns it away over a lock, like sqlite's busy timeout
+VOTE_LOCK_RETRY_SECONDS = getattr(settings, 'VOTE_LOCK_RETRY_SECONDS', 5)
+
+
+def toggle_upvote(voting_user, post, post_comment=None, origin=None):
+    return cast_vote(voting_user, post, post_comment, vote=True, toggle=True, origin=origin)
+
+
+def toggle_downvote(voting_user, post, post_comment=None, origin=None):
+    return cast_vote(voting_user, post, post_comment, vote=False, toggle=True, origin=origin)
+
+
+def cast_vote(voting_user, post, post_comment=None, vote=True, toggle=False, origin=None):
+    """
+    Move the user's vote on a post or comment to ``vote`` (True up, False down, None cleared).
+
+    With ``toggle`` a vote equal to the current one clears it instead. The like row, the
+    object's like/dislike counters and a ReputationEvent for the author all change in one
+    transaction using a fixed number of statements; the author's reputation totals follow
+    at the next rollup_reputation. ``origin`` names the voter's live stream, which is sent
+    everyone else's votes but not this one. Returns the change in the author's reputation.
+    """
+    deadline = time.monotonic() + VOTE_LOCK_RETRY_SECONDS
+    conflicts = 0
+    retried_insert = False
+    while True:
+        try:
+            with transaction.atomic():
+                return _cast_vote(voting_user, post, post_comment, vote, toggle, origin)
+        except IntegrityError:
+            # a concurrent request inserted the same like or member row first, the retry sees it
+            if retried_insert:
+                raise
+            retried_insert = True
+            logger.info(f'retrying vote by {voting_user} on post {post.id}')
+        except OperationalError as e:
+            # sqlite has no row locks and turns away a second writer instead of queueing it, other
+            # databases may pick the vote as a deadlock victim; it waits a moment and starts over.
+            # Inside an outer transaction the locks it already holds would stay, so it gives up.
+            if time.monotonic() > deadline or connection.in_atomic_block or not is_lock_conflict(e):
+                raise
+            conflicts += 1
+            logger.info(f'vote by {voting_user} on post {post.id} hit a lock conflict, retrying')
+            time.sleep(random.uniform(0, min(0.05, 0.001 * 2 ** conflicts)))
+
+
+def is_lock_conflict(error):
+    message = str(error).lower()
+    # sqlite says 'database is locked', or 'database table is locked' for a shared cache in-memory database
+    return 'is locked' in message or 'deadlock' in message
+
+
+def _cast_vote(voting_user, post, post_comment, vote, toggle, origin):
+    pcl = PostCommentLike.objects.select_for_update().filter(
+        user=voting_user, post=post, post_comment=post_comment).values_list('id', 'upvote').first()
+
+    current = pcl[1] if pcl else None
+    new = None if toggle and current == vote else vote
+    if new == current:
+        return 0
+
+    if pcl is None:
+        PostCommentLike.objects.create(user=voting_user, post=post, post_comment=post_comment, upvote=new)
+    elif new is None:
+        PostCommentLike.objects.filter(id=pcl[0]).delete()
     else:
-        pcl = PostCommentLike.objects.filter(user=user, post=post, upvote=True)
-
-    if pcl.exists():
-        pcl.first().delete()
-        return True
+        PostCommentLike.objects.filter(id=pcl[0]).update(upvote=new)
 
-    return False
+    like_change = (new is True) - (current is True)
+    dislike_change = (new is False) - (current is False)
+    rep_change = VOTE_VALUES[new] - VOTE_VALUES[current]
 
-
-def remove_downvote_if_exists(user, post, post_comment=None):
-    if post_comment:
-        pcl = PostCommentLike.objects.filter(user=user, post=post, post_comment=post_comment, upvote=False)
+    author = post_comment or post
+    record_reputation(author.community_id, author.user_id, rep_change)
+    if buffering_enabled():
+        # counters are written behind by the buffer's flusher, once this vote has committed
+        transaction.on_commit(lambda: vote_buffer.add_vote_counts(like_change, dislike_change, post, post_comment))
     else:
-        pcl = PostCommentLike.objects.filter(user=user, post=post, upvote=False)
+        add_vote_counts(like_change, dislike_change, post, post_comment)
 
-    if pcl.exists():
-        pcl.first().delete()
-        return True
+    if like_change or dislike_change:
+        transaction.on_commit(lambda: publish_vote(post, post_comment, like_change - dislike_change, origin))
+        transaction.on_commit(lambda: purge_for_post_activity(post))
 
-    return False
+    return rep_change
 
 
-def add_user_rep(rep_val, post, post_comment=None):
+def add_vote_counts(like_change, dislike_change, post, post_comment=None):
+    changes = {'like_count': F('like_count') + like_change, 'dislike_count': F('dislike_count') + dislike_change}
     if post_comment:
-        community = post_comment.community
-        user = post_comment.user
+        PostComment.objects.filter(id=post_comment.id).update(**changes)
     else:
-        community = post.community
-        user = post.user
-
-    # if user is not a member of the community, add them but follow status is false
-    try:
-        community_member = CommunityMember.objects.get(community=community, user=user)
-    except CommunityMember.DoesNotExist:
-        community_member = CommunityMember.objects.create(
-            community=community,
-            user=user,
-            following=False
-        )
-        community_member.save()
-
-    user_meta = UserMeta.objects.get(user=user)
-    community_member.add_community_rep(rep_val)
-    user_meta.add_reputation(rep_val)
+        Post.objects.filter(id=post.id).update(**changes, **score_changes(like_change - dislike_change))
 
 
 def create_voting(user, post, post_comment=None):
-    if post_comment:
-        obj = post_comment
-    else:
-        obj = post
-
-    add_user_rep(rep_val=1, post=post, post_comment=post_comment)
-    add_upvote(user=user, post=post, post_comment=post_comment)
-    obj.like_count = F('like_count') + 1
-    obj.save()
-
+    cast_vote(user, post, post_comment, vote=True)
+
+
+def attach_user_votes(user, posts=(), post_comments=()):
+    """
+    Load the user's votes for every post and comment on a page with a single query.
+
+    Sets ``user_vote`` on each object to True (upvote), False (downvote) or None so the
+    has_user_upvote / has_user_downvote template filters can answer without a query.
+    Querysets must be evaluated (e.g. wrapped in list()) before being passed in, otherwise
+    the attribute is lost when the template iterates them again.
+    """
+    post_ids = [post.id for post in posts]
+    comment_ids = [post_comment.id for post_comment in post_comments]
+
+    post_votes = {}
+    comment_votes = {}
+    if user.is_authenticated and (post_ids or comment_ids):
+        pcls = PostCommentLike.objects.filter(user=user).filter(
+            Q(post_id__in=post_ids, post_comment=None) | Q(post_comment_id__in=comment_ids)
+        ).values_list('post_id', 'post_comment_id', 'upvote')
+
+        for post_id, post_comment_id, upvote in pcls:
+            if post_comment_id:
+                comment_votes[post_comment_id] = upvote
+            else:
+                post_votes[post_id] = upvote
+
+    for post in posts:
+        post.user_vote = post_votes.get(post.id)
+    for post_comment in post_comments:
+        post_comment.user_vote = comment_votes.get(post_comment.id)
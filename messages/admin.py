@@ -1,3 +1,20 @@
 from django.contrib import admin
+from .models import Conversation, ConversationMember, DirectMessage
+
 
 # Register your models here.
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('key', 'last_message_at')
+
+
+@admin.register(ConversationMember)
+class ConversationMemberAdmin(admin.ModelAdmin):
+    list_display = ('user', 'conversation', 'unread_count', 'last_message_at')
+    raw_id_fields = ('conversation',)
+
+
+@admin.register(DirectMessage)
+class DirectMessageAdmin(admin.ModelAdmin):
+    list_display = ('sender', 'receiver', 'created_at')
+    raw_id_fields = ('conversation',)
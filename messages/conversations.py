@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .models import Conversation, ConversationMember, DirectMessage
+
+
+def send_message(sender, receiver, text):
+    """
+    Add a message to the sender and receiver's conversation and update its summaries.
+
+    The conversation's last message, each member's last activity and the receiver's
+    unread count are written in the same transaction as the message.
+    """
+    conversation = Conversation.objects.between(sender, receiver)
+    with transaction.atomic():
+        message = DirectMessage.objects.create(conversation=conversation, sender=sender, receiver=receiver,
+                                               message=text)
+        Conversation.objects.filter(id=conversation.id).update(last_message=message,
+                                                               last_message_at=message.created_at)
+        ConversationMember.objects.filter(conversation=conversation).update(
+            last_message_at=message.created_at,
+            unread_count=Case(When(user=receiver, then=F('unread_count') + 1), default=F('unread_count')),
+        )
+    return message
+
+
+def mark_read(member):
+    if member.unread_count:
+        ConversationMember.objects.filter(id=member.id).update(unread_count=0, last_read_at=timezone.now())
+        member.unread_count = 0
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from messages.models import Conversation, ConversationMember, DirectMessage
+
+
+class Command(BaseCommand):
+    help = 'Group direct messages sent before conversations existed into conversations and fill their summaries.'
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.in_bulk
+        pairs = {tuple(sorted(pair)) for pair in DirectMessage.objects.filter(conversation=None).values_list(
+            'sender_id', 'receiver_id').distinct()}
+
+        for low, high in pairs:
+            pair_users = users([low, high])
+            conversation = Conversation.objects.between(pair_users[low], pair_users[high])
+            DirectMessage.objects.filter(Q(sender_id=low, receiver_id=high) | Q(sender_id=high, receiver_id=low),
+                                         conversation=None).update(conversation=conversation)
+
+            last_message = conversation.messages.order_by('-created_at', '-id').first()
+            Conversation.objects.filter(id=conversation.id).update(last_message=last_message,
+                                                                   last_message_at=last_message.created_at)
+            # read state was never tracked, old messages start out read
+            ConversationMember.objects.filter(conversation=conversation).update(
+                last_message_at=last_message.created_at)
+
+        self.stdout.write(self.style.SUCCESS(f'Built {len(pairs)} conversations.'))
@@ -1,8 +1,58 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
 
+class ConversationManager(models.Manager):
+    def between(self, user, other_user):
+        """The two users' conversation, created along with its members the first time."""
+        low, high = sorted((user.id, other_user.id))
+        conversation = self.filter(key=f'{low}:{high}').first()
+        if conversation:
+            return conversation
+
+        with transaction.atomic():
+            conversation, created = self.get_or_create(key=f'{low}:{high}')
+            if created:
+                ConversationMember.objects.bulk_create([ConversationMember(conversation=conversation, user_id=user_id)
+                                                        for user_id in {low, high}], ignore_conflicts=True)
+        return conversation
+
+
+class Conversation(models.Model):
+    key = models.CharField(max_length=50, unique=True)  # "<lower user id>:<higher user id>"
+
+    # summary of the newest message, written by send_message
+    last_message = models.ForeignKey('DirectMessage', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='+')
+    last_message_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ConversationManager()
+
+    def __str__(self):
+        return self.key
+
+
+class ConversationMember(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations')
+    unread_count = models.IntegerField(default=0)
+    last_message_at = models.DateTimeField(blank=True, null=True)  # copied from the conversation for the inbox index
+    last_read_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('conversation', 'user')
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='conversation_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.conversation}'
+
+
 class DirectMessage(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', null=True)
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='received_messages')
     message = models.TextField()
@@ -10,5 +60,10 @@ class DirectMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', '-created_at', '-id'], name='message_thread_idx'),
+        ]
+
     def __str__(self):
         return self.message
@@ -1,3 +1,46 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from .conversations import send_message
+from .models import Conversation, ConversationMember
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob, self.carol = [User.objects.create_user(username=name, password='password')
+                                            for name in ('alice', 'bob', 'carol')]
+
+    def test_messages_thread_into_one_conversation_per_pair(self):
+        send_message(self.alice, self.bob, 'hi bob')
+        send_message(self.bob, self.alice, 'hi alice')
+        send_message(self.alice, self.bob, 'how are you')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(list(conversation.messages.values_list('message', flat=True).order_by('id')),
+                         ['hi bob', 'hi alice', 'how are you'])
+        self.assertEqual(conversation.last_message.message, 'how are you')
+        unread = dict(ConversationMember.objects.values_list('user__username', 'unread_count'))
+        self.assertEqual(unread, {'alice': 1, 'bob': 2})
+
+    def test_inbox_lists_latest_conversations_first_and_reading_clears_unread(self):
+        first = send_message(self.bob, self.alice, 'from bob').conversation
+        second = send_message(self.carol, self.alice, 'from carol').conversation
+        self.client.force_login(self.alice)
+
+        response = self.client.get('/m/')
+        self.assertEqual([member.conversation_id for member in response.context['conversations']],
+                         [second.id, first.id])
+
+        response = self.client.get(f'/m/{first.id}/')
+        self.assertEqual([message.message for message in response.context['messages']], ['from bob'])
+        self.assertEqual(ConversationMember.objects.get(conversation=first, user=self.alice).unread_count, 0)
+        self.assertEqual(ConversationMember.objects.get(conversation=second, user=self.alice).unread_count, 1)
+
+        self.client.post(f'/m/{first.id}/', {'message': 'hello back'})
+        self.assertEqual(ConversationMember.objects.get(conversation=first, user=self.bob).unread_count, 1)
+        self.assertEqual(first.messages.latest('id').receiver, self.bob)
+
+    def test_only_members_can_read_a_conversation(self):
+        conversation = send_message(self.alice, self.bob, 'private').conversation
+        self.client.force_login(self.carol)
+        self.assertEqual(self.client.get(f'/m/{conversation.id}/').status_code, 404)
@@ -5,4 +5,6 @@ from . import views
 app_name = 'messages'
 urlpatterns = [
     path('', views.index, name='index'),
-]
\ No newline at end of file
+    path('<int:conversation_id>/', views.ConversationView.as_view(), name='conversation'),
+    path('new/<str:username>/', views.start_conversation, name='start-conversation'),
+]
@@ -1,12 +1,68 @@
-from django.shortcuts import render
-from .models import DirectMessage
+from django.shortcuts import render, redirect, get_object_or_404
+from django.views import View
+from django.contrib.auth import get_user_model
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 
+from communities.pagination import paginate_by_cursor
+from .conversations import send_message, mark_read
+from .forms import DirectMessageForm
+from .models import Conversation, ConversationMember
+
+
+def other_members(conversation, user):
+    # a conversation with yourself has no other member
+    return [member.user for member in conversation.members.all() if member.user_id != user.id] or [user]
+
 
 # Create your views here.
 @login_required(login_url='/accounts/login/?next=/m/')
 def index(request):
-    messages = DirectMessage.objects.filter(receiver=request.user).values('sender').distinct()
-    return render(request, 'messages/index.html', {'messages': messages})
+    conversations = ConversationMember.objects.filter(user=request.user, last_message_at__isnull=False).select_related(
+        'conversation__last_message__sender').prefetch_related('conversation__members__user')
+    conversations, next_cursor = paginate_by_cursor(conversations, request.GET.get('cursor'),
+                                                    keys=('last_message_at', 'id'))
+    for member in conversations:
+        member.other_users = other_members(member.conversation, request.user)
+    return render(request, 'messages/index.html', {'conversations': conversations, 'next_cursor': next_cursor})
+
+
+@login_required(login_url='/accounts/login/?next=/m/')
+def start_conversation(request, username):
+    other_user = get_object_or_404(get_user_model(), username=username)
+    conversation = Conversation.objects.between(request.user, other_user)
+    return redirect('messages:conversation', conversation_id=conversation.id)
+
+
+class ConversationView(LoginRequiredMixin, View):
+    login_url = '/accounts/login/?next=/m/'
+    form = DirectMessageForm
+    template_name = 'messages/conversation.html'
+
+    def get_member(self, request, conversation_id):
+        return get_object_or_404(ConversationMember.objects.select_related('conversation'),
+                                 conversation_id=conversation_id, user=request.user)
+
+    def render_thread(self, request, member, form):
+        conversation = member.conversation
+        messages, next_cursor = paginate_by_cursor(conversation.messages.select_related('sender'),
+                                                   request.GET.get('cursor'))
+        mark_read(member)
+        return render(request, self.template_name, {'conversation': conversation,
+                                                    'other_users': other_members(conversation, request.user),
+                                                    'messages': messages[::-1],  # oldest first on the page
+                                                    'next_cursor': next_cursor,
+                                                    'form': form})
 
+    def get(self, request, conversation_id):
+        member = self.get_member(request, conversation_id)
+        return self.render_thread(request, member, self.form())
 
+    def post(self, request, conversation_id):
+        member = self.get_member(request, conversation_id)
+        form = self.form(request.POST)
+        if form.is_valid():
+            receiver = other_members(member.conversation, request.user)[0]
+            send_message(request.user, receiver, form.cleaned_data['message'])
+            return redirect('messages:conversation', conversation_id=conversation_id)
+        return self.render_thread(request, member, form)
@@ -13,4 +13,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mors_tyrannis.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.urls import resolve, Resolver404  # noqa: E402, needs the apps loaded above
+from communities.live import live_stream, live_stream_app  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # live update streams are held open for as long as the page is, so they are served by a
+    # plain coroutine instead of a Django view taking up a worker thread each
+    if scope['type'] == 'http' and scope['path'].endswith('/live/'):
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            match = None
+        if match is not None and match.func is live_stream:
+            return await live_stream_app(scope, receive, send, **match.kwargs)
+    return await django_application(scope, receive, send)
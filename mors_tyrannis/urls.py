@@ -26,4 +26,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('u/', include('users.urls')),
     path('c/', include('communities.urls')),
+    path('m/', include('messages.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserMeta
+from .models import UserMeta, Notification
 
 
 # Register your models here.
@@ -9,3 +9,10 @@ class UserMetaAdmin(admin.ModelAdmin):
     list_editable = ('reputation',)
     search_fields = ('user',)
     list_filter = ('reputation',)
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'kind', 'read', 'created_at')
+    list_filter = ('kind', 'read')
+    raw_id_fields = ('recipient', 'comment')
@@ -0,0 +1,34 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import Notification
+from users.notifications import discount_unread
+
+
+class Command(BaseCommand):
+    help = 'Delete notifications older than the retention period, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired = Notification.objects.filter(created_at__lt=timezone.now() - timedelta(days=options['days']))
+        count = 0
+        while True:
+            # short batches keep each DELETE's locks brief on a large table
+            batch = list(expired.order_by('id').values_list('id', 'recipient_id', 'read')[:options['batch_size']])
+            if not batch:
+                break
+
+            Notification.objects.filter(id__in=[notification_id for notification_id, _, _ in batch]).delete()
+            unread = Counter(recipient_id for _, recipient_id, read in batch if not read)
+            if unread:
+                discount_unread(unread)
+            count += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Pruned {count} notifications.'))
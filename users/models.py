@@ -9,6 +9,7 @@ class UserMeta(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     reputation = models.IntegerField(default=0)
     last_notification_check = models.DateTimeField(auto_now_add=True)
+    unread_notifications = models.IntegerField(default=0)  # replies since the last visit, see users.notifications
 
     def __str__(self):
         return self.user.username
@@ -16,3 +17,29 @@ class UserMeta(models.Model):
     def add_reputation(self, rep):
         self.reputation = F('reputation') + rep
         self.save()
+
+
+class Notification(models.Model):
+    POST_REPLY = 'post_reply'
+    COMMENT_REPLY = 'comment_reply'
+    KIND_CHOICES = [
+        (POST_REPLY, 'Reply to your post'),
+        (COMMENT_REPLY, 'Reply to your comment'),
+    ]
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    comment = models.ForeignKey('communities.PostComment', on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    read = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the inbox is paged newest first per recipient, see users.views.NotificationCenterView
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_inbox_idx'),
+            models.Index(fields=['created_at'], name='notification_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipient} - {self.get_kind_display()}'
@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import UserMeta, Notification
+
+UNREAD_CACHE_TIMEOUT = 60 * 60
+
+
+def unread_cache_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def notify_comment(comment):
+    """Write inbox rows for the post's author and the parent comment's author and bump their unread counters."""
+    recipients = {comment.post.user_id: Notification.POST_REPLY}
+    if comment.parent_comment_id:
+        recipients[comment.parent_comment.user_id] = Notification.COMMENT_REPLY
+    recipients.pop(comment.user_id, None)
+
+    if recipients:
+        Notification.objects.bulk_create([Notification(recipient_id=user_id, comment=comment, kind=kind)
+                                          for user_id, kind in recipients.items()])
+        UserMeta.objects.filter(user_id__in=recipients.keys()).update(
+            unread_notifications=F('unread_notifications') + 1)
+        transaction.on_commit(lambda: cache.delete_many([unread_cache_key(user_id) for user_id in recipients]))
+
+
+def has_unread_notifications(user):
+    key = unread_cache_key(user.id)
+    unread = cache.get(key)
+    if unread is None:
+        unread = UserMeta.objects.filter(user=user).values_list('unread_notifications', flat=True).first() or 0
+        cache.set(key, unread, UNREAD_CACHE_TIMEOUT)
+    return unread > 0
+
+
+def mark_notifications_read(user, ids):
+    marked = Notification.objects.filter(recipient=user, id__in=ids, read=False).update(read=True)
+    if marked:
+        discount_unread({user.id: marked})
+    return marked
+
+
+def clear_notifications(user):
+    Notification.objects.filter(recipient=user, read=False).update(read=True)
+    UserMeta.objects.filter(user=user).update(unread_notifications=0, last_notification_check=timezone.now())
+    cache.delete(unread_cache_key(user.id))
+
+
+def discount_unread(counts):
+    """Take ``counts`` (user id -> notifications no longer unread) off the users' unread counters."""
+    for user_id, count in counts.items():
+        UserMeta.objects.filter(user_id=user_id).update(
+            unread_notifications=Greatest(F('unread_notifications') - count, 0))
+    cache.delete_many([unread_cache_key(user_id) for user_id in counts])
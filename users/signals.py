@@ -0,0 +1,16 @@
+from collections import Counter
+
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from communities.models import PostComment
+from .models import Notification
+from .notifications import discount_unread
+
+
+@receiver(pre_delete, sender=PostComment)
+def discount_notifications_of_deleted_comment(sender, instance, **kwargs):
+    # the comment's notifications go with it through the cascade, the unread ones leave the counters too
+    unread = Counter(Notification.objects.filter(comment=instance, read=False).values_list('recipient_id', flat=True))
+    if unread:
+        discount_unread(unread)
@@ -1,3 +1,54 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from communities.models import Community, Post, PostComment
+from users.models import Notification, UserMeta
+from users.notifications import has_unread_notifications, mark_notifications_read, notify_comment
+
+
+def create_user(username):
+    user = User.objects.create_user(username=username, password='password')
+    UserMeta.objects.create(user=user)
+    return user
+
+
+class UnreadNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author, self.replier = create_user('author'), create_user('replier')
+        community = Community.objects.create(name='Notify', description='notify')
+        self.post = Post.objects.create(community=community, user=self.author, title='post', post_type='text')
+        self.comment = PostComment.objects.create(post=self.post, community=community, user=self.author,
+                                                  content='comment')
+
+    def reply(self):
+        reply = PostComment.objects.create(post=self.post, community=self.post.community, user=self.replier,
+                                           content='reply', parent_comment=self.comment)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_comment(reply)
+        return reply
+
+    def unread(self):
+        return UserMeta.objects.get(user=self.author).unread_notifications
+
+    def test_replies_count_until_read(self):
+        self.reply()
+        self.reply()
+        self.assertEqual(self.unread(), 2)
+        self.assertTrue(has_unread_notifications(self.author))
+
+        mark_notifications_read(self.author, Notification.objects.values_list('id', flat=True))
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(has_unread_notifications(self.author))
+
+    def test_deleted_comments_take_their_unread_notifications_along(self):
+        self.reply().delete()
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(has_unread_notifications(self.author))
+
+        self.reply()
+        self.post.delete()  # the replies go through the cascade
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(has_unread_notifications(self.author))
@@ -1,10 +1,11 @@
-from django.shortcuts import render
-from django.db.models import Q
+from django.shortcuts import render, redirect
 from django.views import View
+from django.contrib.auth.mixins import LoginRequiredMixin
 
-from communities.models import PostComment
-from .models import UserMeta
-from datetime import datetime
+from communities.pagination import paginate_by_cursor
+from communities.voting.vote_functions import attach_user_votes
+from .models import Notification
+from .notifications import mark_notifications_read, clear_notifications
 
 
 # Create your views here.
@@ -12,12 +13,20 @@ def index(request):
     return render(request, 'users/index.html')
 
 
-class NotificationCenterView(View):
+class NotificationCenterView(LoginRequiredMixin, View):
     def get(self, request):
-        user_meta = UserMeta.objects.get(user=request.user)
-        post_comments = PostComment.objects.filter(((Q(post__user=request.user) & Q(postcomment=None))
-                                                    | Q(postcomment__user=request.user))
-                                                   & Q(created_at__gt=user_meta.last_notification_check))
-        user_meta.last_notification_check = datetime.utcnow()
-        user_meta.save()
-        return render(request, 'users/notification-center.html', {'post_comments': post_comments})
\ No newline at end of file
+        notifications = Notification.objects.filter(recipient=request.user).select_related(
+            'comment__user', 'comment__community', 'comment__post')
+        notifications, next_cursor = paginate_by_cursor(notifications, request.GET.get('cursor'))
+        attach_user_votes(request.user, post_comments=[notification.comment for notification in notifications])
+
+        # the page keeps showing which rows were new, only the stored flag is flipped
+        mark_notifications_read(request.user, [notification.id for notification in notifications
+                                               if not notification.read])
+        return render(request, 'users/notification-center.html', {'notifications': notifications,
+                                                                  'next_cursor': next_cursor})
+
+    def post(self, request):
+        # mark all read
+        clear_notifications(request.user)
+        return redirect('users:notifications')